@@ -2,4 +2,6 @@
     Harmony search algorithm
 """
 
-from . import *
\ No newline at end of file
+# The modules are also used as top-level modules (scripts, tests), where the checkout is no package
+if __package__:
+    from . import *
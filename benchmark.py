@@ -0,0 +1,246 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from harmony_search import HarmonySearch
+from objective_function import ObjectiveFunction
+from schedules import SCHEDULES
+from stopping import TargetCoverage
+from targets import save_targets
+
+PRESETS = {
+    "quick": {"aoi": [50, 200], "hmv": [25, 100], "hms": [10, 100], "types": [2, 4]},
+    "full": {"aoi": [50, 200, 500, 1000, 2000], "hmv": [25, 100, 250, 500], "hms": [10, 100, 500], "types": [2, 4]},
+}
+
+
+def make_problem(aoi, hmv, hms, types, cell=10, n_search=10, savedir=None, **kwargs):
+    """
+        Square field of side aoi with one target per cell, radii chosen so that hmv sensors can cover it
+    """
+    r_max = max(10, math.ceil(aoi / math.sqrt(hmv)))
+    radius = [r_max * (k + 1) // types for k in range(types)]
+    targets = [[x + cell / 2, y + cell / 2] for x in range(0, aoi, cell) for y in range(0, aoi, cell)]
+    obj_func = ObjectiveFunction(hmv, hms, targets, types=types, radius=radius, w=aoi, h=aoi, cell_h=cell, cell_w=cell)
+    hsa = HarmonySearch(obj_func, [aoi, aoi], [cell, cell], hms=hms, hmv=hmv,
+                        lower=[[r/2, r/2] for r in radius], upper=[[aoi - r/2, aoi - r/2] for r in radius],
+                        savedir=savedir, n_search=n_search, **kwargs)
+    return obj_func, hsa
+
+
+def peak_rss():
+    """
+        Peak resident set size of this process so far, in bytes
+    """
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def time_call(function, repeat, calibrate=True, min_time=0.005):
+    """
+        Median and minimum wall time per call of function over repeat samples,
+        fast functions are looped within a sample until it lasts min_time
+    """
+    number = 1
+    while calibrate:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - start >= min_time:
+            break
+        number *= 2
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+    return {"seconds": float(np.median(times)), "min": float(np.min(times)), "repeat": repeat, "number": number}
+
+
+def bench_case(case, args, workdir):
+    """
+        Time the objective function and the search loop on one problem size
+    """
+    savedir = os.path.join(workdir, "case")
+    shutil.rmtree(savedir, ignore_errors=True)
+    obj_func, hsa = make_problem(case["aoi"], case["hmv"], case["hms"], case["types"], savedir=savedir)
+    hsa.reseed(args.seed)
+    hsa._initialize_harmony("default")
+
+    harmony, type_trace, _ = hsa._harmony_memory[hsa._harmony_memory.best()]
+    used = [node for node in harmony if node[0] >= 0 and node[1] >= 0]
+    type_trace = type_trace if len(type_trace) == len(used) else hsa.rng.integers(case["types"], len(used)).tolist()
+    scalar = len(used) * len(obj_func.targets) <= args.max_scalar_pairs
+
+    timings = {
+        "get_fitness": lambda: obj_func.get_fitness(harmony),
+        "get_fitness_batch": lambda: obj_func.get_fitness_batch(hsa._memory_consideration_batch(hsa.n_search)[0]),
+        "_coverage_ratio_np": lambda: obj_func._coverage_ratio_np(used, type_trace),
+        "_md_np": lambda: obj_func._md_np(used, type_trace),
+        "_memory_consideration": hsa._memory_consideration,
+        "_memory_consideration_batch": lambda: hsa._memory_consideration_batch(hsa.n_search),
+        "_new_harmony_consideration": lambda: hsa._new_harmony_consideration(harmony, float("-inf"), type_trace),
+    }
+    if scalar:
+        timings["_coverage_ratio"] = lambda: obj_func._coverage_ratio(used, type_trace)
+        timings["_md"] = lambda: obj_func._md(used, type_trace)
+
+    results = []
+    for name, function in timings.items():
+        results.append(dict(case=case, name=name, **time_call(function, args.repeat), peak_rss=peak_rss()))
+
+    def run():
+        hsa._run("default", steps=args.steps, order=0, seed=args.seed, progress=False)
+    results.append(dict(case=case, name="run_{}_steps".format(args.steps), **time_call(run, 1, calibrate=False),
+                        peak_rss=peak_rss()))
+    hsa.close()
+    return results
+
+
+def bench_schedules(case, args, workdir):
+    """
+        Fitness evaluations each parameter schedule needs to reach the target coverage, over args.target_runs seeds
+    """
+    results = []
+    for name in args.schedules:
+        evaluations = []
+        for run in range(args.target_runs):
+            savedir = os.path.join(workdir, "schedule")
+            shutil.rmtree(savedir, ignore_errors=True)
+            _, hsa = make_problem(case["aoi"], case["hmv"], case["hms"], case["types"], savedir=savedir,
+                                  schedule=SCHEDULES[name](), stopping=[TargetCoverage(args.target_coverage)])
+            try:
+                result = hsa._run("default", steps=args.target_steps, order=0, seed=args.seed + run, progress=False)
+            finally:
+                hsa.close()
+            evaluations.append(hsa.evaluations if result["stop_reason"] == "coverage" else None)
+        reached = [count for count in evaluations if count is not None]
+        results.append(dict(case=case, name="evaluations_to_{}_{}".format(args.target_coverage, name), evaluations=evaluations,
+                            reached=len(reached), median=float(np.median(reached)) if reached else None))
+        print(f'{name:<16} reached {len(reached)}/{args.target_runs} median evaluations {results[-1]["median"]}')
+    return results
+
+
+def _field_case(path, aoi, hmv, batch, spatial_index, budget, repeat, seed):
+    """
+        Coverage of one batch on a memory-mapped field, run in a fresh process so that its peak RSS is its own
+    """
+    obj_func = ObjectiveFunction(hmv, batch, path, radius=[5, 10], w=aoi, h=aoi, spatial_index=spatial_index,
+                                 memory_budget=budget)
+    rng = np.random.default_rng(seed)
+    harmonies = rng.uniform(0, aoi, (batch, hmv, 2))
+    types = rng.integers(0, 2, (batch, hmv))
+    _, coverage, _ = obj_func.get_fitness_batch(harmonies, types)
+    timing = time_call(lambda: obj_func.get_fitness_batch(harmonies, types), repeat, calibrate=False)
+    return dict(timing, peak_rss=peak_rss(), coverage=coverage.tolist())
+
+
+def bench_field(args, workdir):
+    """
+        Time and peak RSS of the coverage of a large random field, stored as a memory-mapped target file,
+        under each memory budget; the coverage must not depend on the budget
+    """
+    aoi = int(math.sqrt(args.field_targets) * 10)
+    path = os.path.join(workdir, "field.npy")
+    save_targets(path, np.random.default_rng(args.seed).uniform(0, aoi, (args.field_targets, 2)))
+    results = []
+    for spatial_index in [False, True]:
+        reference = None
+        for budget in args.memory_budget:
+            budget = None if budget <= 0 else budget
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                entry = executor.submit(_field_case, path, aoi, args.field_hmv, args.field_batch, spatial_index, budget,
+                                        args.repeat, args.seed).result()
+            coverage = entry.pop("coverage")
+            reference = coverage if reference is None else reference
+            case = {"targets": args.field_targets, "hmv": args.field_hmv, "batch": args.field_batch,
+                    "spatial_index": spatial_index, "memory_budget": budget}
+            results.append(dict(case=case, name="field_coverage", identical=coverage == reference, **entry))
+            print(f'{str(case):<100} {entry["min"]:.4f}s peak RSS {entry["peak_rss"] / 2**20:.1f} MiB '
+                  f'identical {coverage == reference}')
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+        Flag the timings that got slower than baseline by more than tolerance, compared on the fastest sample
+    """
+    key = lambda entry: (json.dumps(entry["case"], sort_keys=True), entry["name"])
+    base = {key(entry): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results["results"]:
+        if key(entry) not in base or "min" not in entry:
+            continue
+        ratio = entry["min"] / base[key(entry)]["min"]
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        print(f'{entry["name"]:<32} {str(entry["case"]):<60} {ratio:6.2f}x {flag}')
+        if flag:
+            regressions.append(entry)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the objective function and the search loop")
+    parser.add_argument("--preset", default="quick", choices=list(PRESETS))
+    parser.add_argument("--aoi", nargs="+", type=int)
+    parser.add_argument("--hmv", nargs="+", type=int)
+    parser.add_argument("--hms", nargs="+", type=int)
+    parser.add_argument("--types", nargs="+", type=int)
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--steps", default=20, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--max-scalar-pairs", default=100000, type=int)
+    parser.add_argument("--output", default="benchmark.json", type=str)
+    parser.add_argument("--compare", default=None, type=str)
+    parser.add_argument("--tolerance", default=0.1, type=float)
+    parser.add_argument("--schedules", nargs="*", default=[], choices=list(SCHEDULES))
+    parser.add_argument("--target-coverage", default=0.9, type=float)
+    parser.add_argument("--target-runs", default=5, type=int)
+    parser.add_argument("--target-steps", default=5000, type=int)
+    parser.add_argument("--field-targets", default=0, type=int)
+    parser.add_argument("--field-hmv", default=100, type=int)
+    parser.add_argument("--field-batch", default=10, type=int)
+    parser.add_argument("--memory-budget", nargs="+", default=[0, 2**26, 2**24], type=int)
+
+    args = parser.parse_args()
+    matrix = dict(PRESETS[args.preset])
+    for name in matrix:
+        if getattr(args, name) is not None:
+            matrix[name] = getattr(args, name)
+
+    results = {"meta": {"python": sys.version.split()[0], "numpy": np.__version__, "platform": platform.platform(),
+                        "matrix": matrix, "repeat": args.repeat, "steps": args.steps, "seed": args.seed},
+               "results": []}
+    workdir = tempfile.mkdtemp()
+    try:
+        for aoi, hmv, hms, types in itertools.product(matrix["aoi"], matrix["hmv"], matrix["hms"], matrix["types"]):
+            case = {"aoi": aoi, "hmv": hmv, "hms": hms, "types": types}
+            print("Case:", case)
+            results["results"].extend(bench_case(case, args, workdir))
+            if args.schedules:
+                results["results"].extend(bench_schedules(case, args, workdir))
+        if args.field_targets > 0:
+            results["results"].extend(bench_field(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
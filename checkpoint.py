@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import numpy as np
+
+
+class Checkpointer():
+    def __init__(self, directory, interval=1000):
+        """
+            Periodic checkpoints of a run, written atomically from a background thread
+
+            :param directory: where the checkpoint files are kept
+            :param interval: number of steps between two checkpoints
+        """
+        self.directory = directory
+        self.interval = interval
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Only the latest pending checkpoint is kept, a slow disk drops intermediate ones instead of stalling the search
+        self._pending = None
+        self._condition = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _state_path(self, order):
+        return os.path.join(self.directory, 'run{}.npz'.format(order))
+
+    def _result_path(self, order):
+        return os.path.join(self.directory, 'result{}.json'.format(order))
+
+    def due(self, step):
+        return self.interval > 0 and (step + 1) % self.interval == 0
+
+    def save(self, order, state):
+        """
+            Queue state (a dict of arrays and scalars) as the checkpoint of run order, arrays are copied here
+        """
+        state = {key: np.array(value) for key, value in state.items()}
+        with self._condition:
+            self._pending = (self._state_path(order), state)
+            self._condition.notify()
+
+    def load(self, order):
+        path = self._state_path(order)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+
+    def save_result(self, order, result):
+        self.flush()
+        self._atomic_write(self._result_path(order), lambda f: f.write(json.dumps(result).encode()))
+
+    def load_result(self, order):
+        path = self._result_path(order)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def flush(self):
+        """
+            Wait until the pending checkpoint is on disk
+        """
+        with self._condition:
+            while self._pending is not None:
+                self._condition.wait()
+
+    def close(self):
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._writer.join()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                path, state = self._pending
+            self._atomic_write(path, lambda f: np.savez(f, **state))
+            with self._condition:
+                if self._pending is not None and self._pending[1] is state:
+                    self._pending = None
+                self._condition.notify_all()
+
+    def _atomic_write(self, path, write):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
@@ -0,0 +1,86 @@
+import os
+import threading
+import queue
+import numpy as np
+
+
+class ConvergenceRecorder():
+    COLUMNS = ["step", "evaluations", "best_fitness", "coverage", "sensors"]
+
+    def __init__(self, path, capacity=4096, every=1, snapshots=False, logger=None):
+        """
+            Convergence trace of a run, rows are buffered in a preallocated array and appended to a csv file
+            by a background thread
+
+            :param path: csv file the rows are appended to
+            :param capacity: number of rows buffered before a flush
+            :param every: keep at most one row per every steps
+            :param snapshots: also keep the positions and types of the best harmony of every row,
+                              saved next to path as .npz when the recorder is closed
+            :param logger: optional logger that gets a text line per row
+        """
+        self.path = path
+        self.every = every
+        self.snapshots = snapshots
+        self.logger = logger
+        self._rows = np.empty((capacity, len(self.COLUMNS)))
+        self._size = 0
+        self._last_step = None
+        self._snapshots = {"step": [], "positions": [], "types": []}
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def record(self, step, evaluations, fitness, coverage, sensors, positions=None, types=None, force=False):
+        """
+            Append a row, dropped when it comes less than every steps after the previous one unless force is set
+        """
+        if not force and self._last_step is not None and step - self._last_step < self.every:
+            return
+        self._last_step = step
+        self._rows[self._size] = (step, evaluations, fitness, coverage, sensors)
+        self._size += 1
+        if self.snapshots and positions is not None:
+            self._snapshots["step"].append(step)
+            self._snapshots["positions"].append(np.array(positions))
+            self._snapshots["types"].append(np.array(types))
+        if self._size == len(self._rows):
+            self.flush()
+
+    def flush(self):
+        """
+            Hand the buffered rows to the writer thread
+        """
+        if self._size:
+            self._queue.put(self._rows[:self._size].copy())
+            self._size = 0
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        if self.snapshots and self._snapshots["step"]:
+            np.savez(os.path.splitext(self.path)[0] + '_snapshots.npz', step=np.array(self._snapshots["step"]),
+                     positions=np.stack(self._snapshots["positions"]), types=np.stack(self._snapshots["types"]))
+
+    def _write_loop(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            header = "" if os.path.exists(self.path) else ",".join(self.COLUMNS)
+            with open(self.path, 'a') as f:
+                np.savetxt(f, chunk, delimiter=",", header=header, comments="", fmt=["%d", "%d", "%.17g", "%.17g", "%d"])
+            if self.logger is not None:
+                for step, evaluations, fitness, coverage, sensors in chunk:
+                    self.logger.info(f'Step: {int(step)} Evaluations: {int(evaluations)} Best_fitness: {fitness} '
+                                     f'Coverage: {coverage} Sensors: {int(sensors)}')
+
+
+def load_convergence(path):
+    """
+        Read a trace written by ConvergenceRecorder as a dict of columns
+    """
+    data = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+    return {name: data[:, i] for i, name in enumerate(ConvergenceRecorder.COLUMNS)}
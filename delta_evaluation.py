@@ -0,0 +1,105 @@
+import numpy as np
+
+
+class DeltaEvaluator():
+    def __init__(self, objective_function, hms, hmv, debug=False):
+        """
+            Incremental fitness for candidates built from the harmony memory.
+            Every stored harmony keeps, for each of its sensors, the targets in reach of the largest node type and
+            the PSM value and in-radius flag of every type on them, so a candidate only looks up the targets of the
+            sensors that moved or entered. The lookups go through the target index of the objective function (or
+            its memory budget chunks), and the cache grows with the targets in reach of a sensor, not the field.
+
+            :param objective_function: ObjectiveFunction the pairs are computed with
+            :param hms: harmony memory size
+            :param hmv: harmony vector size
+            :param debug: cross-check every delta evaluation against a full recompute
+        """
+        self._obj_function = objective_function
+        self.hms = hms
+        self.hmv = hmv
+        self.debug = debug
+
+        self._model = objective_function.model
+        self._radius = objective_function._radius
+        ntypes = self._model.ntypes
+        # Pairs of node n of slot s at [s, n, :count[s, n]], widened when a sensor reaches more targets
+        self._count = np.zeros((hms, hmv), dtype=int)
+        self._target = np.zeros((hms, hmv, 0), dtype=int)
+        self._p = np.zeros((ntypes, hms, hmv, 0))
+        self._inside = np.zeros((ntypes, hms, hmv, 0), dtype=bool)
+
+    def _widen(self, width):
+        pad = width - self._target.shape[-1]
+        self._target = np.pad(self._target, [(0, 0), (0, 0), (0, pad)])
+        self._p = np.pad(self._p, [(0, 0), (0, 0), (0, 0), (0, pad)], constant_values=self._model.zero)
+        self._inside = np.pad(self._inside, [(0, 0), (0, 0), (0, 0), (0, pad)])
+
+    def _pairs(self, sensors, reach):
+        """
+            (sensor, target, distance) of the targets within reach of each sensor, grouped by sensor
+        """
+        sensor, target, dist = self._obj_function._pairs_within(sensors, reach)
+        order = np.argsort(sensor, kind="stable")
+        return sensor[order], target[order], dist[order]
+
+    def store(self, slot, harmony):
+        """
+            Cache the sensor-target pairs of the harmony stored in slot of the harmony memory
+        """
+        sensors = np.asarray(harmony, dtype=float).reshape(-1, 2)
+        used = np.flatnonzero((sensors[:, 0] >= 0) & (sensors[:, 1] >= 0))
+        sensor, target, dist = self._pairs(sensors[used], self._model.reach.max())
+        count = np.bincount(sensor, minlength=len(used))
+        if count.max(initial=0) > self._target.shape[-1]:
+            self._widen(int(count.max()))
+
+        node = used[sensor]
+        offset = np.arange(len(sensor)) - np.repeat(np.cumsum(count) - count, count)
+        self._count[slot] = 0
+        self._count[slot, used] = count
+        self._target[slot, node, offset] = target
+        types = np.arange(self._model.ntypes)[:, None]
+        self._p[:, slot, node, offset] = self._model.values(dist[None], types)
+        self._inside[:, slot, node, offset] = dist[None] <= self._radius[:, None]
+
+    def get_fitness_batch(self, harmonies, sources, types=None):
+        """
+            Same result as ObjectiveFunction.get_fitness_batch
+            :param harmonies: (B x hmv x 2) candidate harmonies
+            :param sources: (B x hmv) memory slot each node was copied from unchanged, -1 if it moved or is new
+            :param types: optional (B x hmv) type of each node
+        """
+        harmonies, valid, types = self._obj_function._prepare_batch(harmonies, types)
+        sources = np.asarray(sources)
+        width = self._target.shape[-1]
+
+        # Cached pairs of the nodes copied from the memory
+        b_ind, n_ind = np.nonzero((sources >= 0) & valid)
+        count = self._count[sources[b_ind, n_ind], n_ind]
+        owner = np.repeat(np.arange(len(b_ind)), count)
+        offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        cell = (sources[b_ind, n_ind] * self.hmv + n_ind)[owner] * width + offset
+        kind = types[b_ind, n_ind][owner]
+        copied = ((b_ind * self.hmv + n_ind)[owner], self._target.reshape(-1)[cell],
+                  self._p.reshape(len(self._radius), -1)[kind, cell], self._inside.reshape(len(self._radius), -1)[kind, cell])
+
+        # Pairs of the nodes that moved or entered
+        b_ind, n_ind = np.nonzero((sources < 0) & valid)
+        sensor, target, dist = self._pairs(harmonies[b_ind, n_ind], self._model.reach[types[b_ind, n_ind]])
+        kind = types[b_ind, n_ind][sensor]
+        moved = ((b_ind * self.hmv + n_ind)[sensor], target, self._model.values(dist, kind), dist <= self._radius[kind])
+
+        # Back in batch order, so every target multiplies its PSMs in the order of the full evaluation
+        node, target, p, inside = (np.concatenate(column) for column in zip(copied, moved))
+        detected = p != self._model.zero
+        order = np.argsort(node[detected], kind="stable")
+        node, target, p, inside = (column[detected][order] for column in (node, target, p, inside))
+        covered = self._obj_function._covered_from_pairs(node // self.hmv, target, p, inside, len(harmonies))
+        fitness, coverage_ratio, type_traces = self._obj_function._fitness_batch(harmonies, types, valid, covered)
+
+        if self.debug:
+            full_fitness, full_coverage, _ = self._obj_function.get_fitness_batch(harmonies, types)
+            assert np.array_equal(fitness, full_fitness) and np.array_equal(coverage_ratio, full_coverage),\
+                "Delta evaluation differs from full recompute"
+        return fitness, coverage_ratio, type_traces
@@ -0,0 +1,60 @@
+from collections import OrderedDict
+import numpy as np
+
+
+class FitnessCache():
+    def __init__(self, capacity=4096, step=1e-6):
+        """
+            Bounded LRU cache of (fitness, coverage ratio, type trace) keyed on the quantized positions and types of the
+            used sensors, or on their positions alone when the types were drawn at random
+
+            :param capacity: maximum number of entries, the least recently used one is evicted first
+            :param step: quantization step of the positions, sensors closer than step share a key
+        """
+        self.capacity = capacity
+        self.step = step
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def key(self, positions, types=None):
+        """
+            Signature of the used sensors positions (n x 2) with their types (n,), of the positions alone when the
+            types are drawn at random (types None)
+        """
+        cells = np.round(np.asarray(positions, dtype=float).reshape(-1, 2) / self.step).astype(np.int64)
+        if types is None:
+            return b"r" + cells.tobytes()
+        return b"t" + cells.tobytes() + np.asarray(types, dtype=np.int64).tobytes()
+
+    def keys(self, harmonies, types, valid):
+        """
+            Signatures of a batch of harmonies (B x hmv x 2), the key of each one is that of its used nodes (valid True)
+        """
+        return [self.key(harmonies[b][valid[b]], None if types is None else types[b][valid[b]])
+                for b in range(len(harmonies))]
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "capacity": self.capacity,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
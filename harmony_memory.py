@@ -0,0 +1,127 @@
+import heapq
+import numpy as np
+
+
+class HarmonyMemory():
+    def __init__(self, hms, hmv):
+        """
+            Harmony memory stored as preallocated arrays, with heaps for best/worst lookup
+
+            :param hms: harmony memory size
+            :param hmv: harmony vector size
+        """
+        self.hms = hms
+        self.hmv = hmv
+        self.positions = np.full((hms, hmv, 2), -1.0)
+        self.types = np.full((hms, hmv), -1, dtype=int)
+        self.fitness = np.full(hms, float('-inf'))
+        self.coverage = np.zeros(hms)
+        self.size = 0
+
+        # Heap entries carry the version of their slot, entries of overwritten slots are dropped lazily
+        self._version = np.zeros(hms, dtype=int)
+        self._worst = []
+        self._best = []
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, slot):
+        """
+            (harmony, type_trace, fitness) stored in slot, the type trace only covers the nodes in use
+        """
+        if slot < 0:
+            slot += self.size
+        if not 0 <= slot < self.size:
+            raise IndexError("harmony memory index out of range")
+        types = self.types[slot]
+        return self.positions[slot].tolist(), types[types >= 0].tolist(), float(self.fitness[slot])
+
+    def __iter__(self):
+        for slot in range(self.size):
+            yield self[slot]
+
+    def append(self, harmony, type_trace, fitness, coverage=0.0):
+        assert self.size < self.hms, "Harmony memory is full"
+        self.size += 1
+        self.set(self.size - 1, harmony, type_trace, fitness, coverage)
+
+    def extend(self, harmonies, type_traces, fitness, coverage):
+        """
+            Append a block of (n x hmv x 2) harmonies at once, type_traces as in set
+        """
+        n = len(harmonies)
+        assert self.size + n <= self.hms, "Harmony memory is full"
+        slots = slice(self.size, self.size + n)
+        self.positions[slots] = harmonies
+        valid = (self.positions[slots] >= 0).all(axis=-1)
+        traced = np.array([len(trace) for trace in type_traces], dtype=int) == valid.sum(axis=1)
+        types = self.types[slots]
+        types[:] = -1
+        if traced.any():
+            types[valid & traced[:, None]] = np.concatenate([type_traces[b] for b in np.flatnonzero(traced)])
+        self.fitness[slots] = fitness
+        self.coverage[slots] = coverage
+        self.size += n
+        self._version[slots] += 1
+        self._rebuild()
+
+    def set(self, slot, harmony, type_trace, fitness, coverage=0.0):
+        """
+            Store harmony in slot, type_trace gives the type of each node in use in order
+        """
+        self.positions[slot] = harmony
+        valid = (self.positions[slot, :, 0] >= 0) & (self.positions[slot, :, 1] >= 0)
+        self.types[slot] = -1
+        if len(type_trace) == np.count_nonzero(valid):
+            self.types[slot, valid] = type_trace
+        self.fitness[slot] = fitness
+        self.coverage[slot] = coverage
+
+        self._version[slot] += 1
+        version = int(self._version[slot])
+        heapq.heappush(self._worst, (float(fitness), slot, version))
+        heapq.heappush(self._best, (-float(fitness), slot, version))
+        if len(self._best) > 4 * self.hms:
+            self._rebuild()
+
+    def restore(self, positions, types, fitness, coverage, size):
+        """
+            Load the arrays of a saved memory
+        """
+        self.positions[:] = positions
+        self.types[:] = types
+        self.fitness[:] = fitness
+        self.coverage[:] = coverage
+        self.size = int(size)
+        self._version += 1
+        self._rebuild()
+
+    def _rebuild(self):
+        self._worst = [(float(self.fitness[slot]), slot, int(self._version[slot])) for slot in range(self.size)]
+        self._best = [(-float(self.fitness[slot]), slot, int(self._version[slot])) for slot in range(self.size)]
+        heapq.heapify(self._worst)
+        heapq.heapify(self._best)
+
+    def _peek(self, heap):
+        while heap[0][2] != self._version[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0][1]
+
+    def top(self, k):
+        """
+            Slots of the k highest fitness, best first
+        """
+        return np.argsort(-self.fitness[:self.size], kind="stable")[:k]
+
+    def worst(self):
+        """
+            Slot of the lowest fitness, the first such slot on ties
+        """
+        return self._peek(self._worst)
+
+    def best(self):
+        """
+            Slot of the highest fitness, the first such slot on ties
+        """
+        return self._peek(self._best)
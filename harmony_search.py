@@ -2,11 +2,31 @@ from math import inf
 import random
 import logging
 from tqdm import tqdm
-from visualize import draw
+from visualize import Renderer
+from delta_evaluation import DeltaEvaluator
+from harmony_memory import HarmonyMemory
+from checkpoint import Checkpointer
+from convergence import ConvergenceRecorder
+from instrumentation import Instrumentation
+from stopping import StoppingCriterion
+from schedules import ParameterSchedule
+from random_stream import RandomStream
+from pareto import ParetoArchive
+import cProfile
 import numpy as np 
 import os 
+from concurrent.futures import ProcessPoolExecutor
 class HarmonySearch():
-    def __init__(self, objective_function, AoI, cell_size, hms=30, hmv=7, hmcr=0.9, par=0.3, BW=0.2, lower=[], upper=[], min_no = 0, savedir = './baseline'):
+    # Initialization strategies and the method generating their harmonies
+    INIT_STRATEGIES = {"default": "_random_selection", "centroid": "_centroid_selection", "cell": "_cell_selection",
+                       "opposition": "_opposition_selection", "lhs": "_latin_hypercube_selection"}
+    # Number of initial harmonies scored per get_fitness_batch call
+    INIT_BLOCK = 128
+
+    def __init__(self, objective_function, AoI, cell_size, hms=30, hmv=7, hmcr=0.9, par=0.3, BW=0.2, lower=[], upper=[], min_no = 0, savedir = './baseline',\
+                n_search=10, batch_eval=True, delta_eval=False, delta_debug=False, checkpoint_interval=0, resume=False,\
+                text_log=False, trace_every=1, trace_snapshots=False, instrument=False, profile_steps=None,\
+                stopping=None, schedule=None, pareto_archive=0, plot="background"):
         """
             param explaination
             
@@ -14,22 +34,55 @@ class HarmonySearch():
             :param hmv: harmony vector size
             :param hmcr: probability for each node considering
             :param par: pitch adjustment rate
-            :param BW: distance bandwidth, used for adjust node position when pich adjustment is applied
-            :param lower: list contains coordinates for bottom corners
-            :param upper: list contains coordinates for upper corners
+            :param BW: distance bandwidth, used for adjust node position when pich adjustment is applied, scalar or (x, y)
+            :param lower: list contains coordinates for bottom corners, one per node type
+            :param upper: list contains coordinates for upper corners, one per node type
+            :param n_search: number of candidates generated per step
+            :param batch_eval: generate and score the candidates of a step as one array
+            :param delta_eval: with batch_eval, only recompute the sensors of a candidate that differ from the memory
+            :param delta_debug: cross-check delta evaluation against a full recompute
+            :param checkpoint_interval: number of steps between two checkpoints of a run, 0 to disable
+            :param resume: reuse an existing savedir and continue its runs from their latest checkpoint
+            :param text_log: also write the convergence trace of each run as text lines to its output log
+            :param trace_every: keep at most one convergence trace row per trace_every steps
+            :param trace_snapshots: save the best harmony of every convergence trace row
+            :param instrument: time the phases of the search loop, the stats of each run are saved to log/stats<order>.json
+            :param profile_steps: (start, stop) window of steps run under cProfile, saved to log/profile<order>.prof
+            :param stopping: list of StoppingCriterion, a run ends at the first one met or after its steps
+            :param schedule: ParameterSchedule giving hmcr, par and BW along a run, constant when not given
+            :param pareto_archive: capacity of a ParetoArchive over (coverage, weighted sensor count) fed with every
+                                   evaluated harmony, whose entries are also considered along with the memory;
+                                   the front of each run is saved to log/front<order>.csv, 0 to disable
+            :param plot: how the best deployment of each run is plotted to plot/fig<order>.png, see Renderer
         """
         self.root_dir = savedir
         self.image_dir = os.path.join(self.root_dir, 'plot')
         self.log_dir = os.path.join(self.root_dir, 'log')
+        self.checkpoint_dir = os.path.join(self.root_dir, 'checkpoint')
         if not os.path.exists(self.root_dir):
             print('Make log dir')
             os.makedirs(self.root_dir)
             os.makedirs(self.image_dir)
             os.makedirs(self.log_dir)
-        else:
+        elif not resume:
             raise ValueError('Save in another dir')
+        self.checkpoint_interval = checkpoint_interval
+        self.resume = resume
+        self.text_log = text_log
+        self.trace_every = trace_every
+        self.trace_snapshots = trace_snapshots
+        self.evaluations = 0
+        self.stats = Instrumentation(instrument)
+        self.profile_steps = profile_steps
+        self.stopping = list(stopping) if stopping is not None else []
+        assert all(isinstance(criterion, StoppingCriterion) for criterion in self.stopping), "Unknown stopping criterion"
+        self.schedule = schedule if schedule is not None else ParameterSchedule()
+        self._chosen = 0
+        self.pareto_archive = pareto_archive
+        self.archive = None
         
         self._obj_function = objective_function
+        self.renderer = Renderer(objective_function, plot)
         self.radius = self._obj_function.get_radius()
         self.hms = hms
         self.hmv = hmv
@@ -38,9 +91,18 @@ class HarmonySearch():
         self.BW = BW
         self.lower = lower
         self.upper = upper
+        self.ntypes = self._obj_function.model.ntypes
+        assert len(lower) == self.ntypes and len(upper) == self.ntypes, "Need bounds for every node type"
+        # A node is kept when it lies within the bounds of at least one type
+        self._low = np.asarray(lower, dtype=float).min(axis=0)
+        self._high = np.asarray(upper, dtype=float).max(axis=0)
         self.min_no = min_no
         self.AoI = AoI
         self.cell_size = cell_size
+        self.n_search = n_search
+        self.batch_eval = batch_eval
+        self._delta = DeltaEvaluator(self._obj_function, self.hms, self.hmv, delta_debug) if delta_eval else None
+        self.reseed()
 
         
         self.logger2 = logging.getLogger(name='best maximum coverage ratio')
@@ -52,191 +114,279 @@ class HarmonySearch():
         self.logger2.addHandler(handler2)
         self.best_coverage = 0
 
-    def _random_selection(self, min_valid):
-        harmony = []
-        for each_node in range(self.hmv):
-            type_ = random.choice([0, 1])
-            if type_ == 0:
-                x = self.lower[0][0] + (self.upper[0][0] - self.lower[0][0])*random.random()
-                y = self.lower[0][1] + (self.upper[0][1] - self.lower[0][1])*random.random()
-            else:
-                x = self.lower[1][0] + (self.upper[1][0] - self.lower[1][0])*random.random()
-                y = self.lower[1][1] + (self.upper[1][1] - self.lower[1][1])*random.random()
-            harmony.append([x, y])
-        return harmony
-    
-    def _centroid_selection(self, min_valid):
-        num_width_cell = self.AoI[0] // self.cell_size[0]
-        num_height_cell = self.AoI[1] // self.cell_size[1]
-        # harmony = [[-1, -1]] * self.hmv
-        # type_trace = [random.choice(range(len(self.upper))) for i in range(self.hmv)]
-        # valid_nodes = random.sample(range(self.hmv), random.randrange(min_valid, num_width_cell*num_height_cell + 1))
-        # id_valid_cell = random.sample(range(num_width_cell*num_height_cell), len(valid_nodes))
-        id_valid_cell = list(range(self.hmv))
-        random.shuffle(id_valid_cell)
-        harmony = []
-        type_trace = []
-        for ids in range(self.hmv):
-            type_ = random.choice([0,1])
-            width_coor = id_valid_cell[ids] % num_width_cell
-            height_coor = id_valid_cell[ids] // num_width_cell
-            x = width_coor * self.cell_size[0] + self.cell_size[0] / 2
-            y = height_coor * self.cell_size[1] + self.cell_size[1] / 2
-            # harmony[each_node] = [x, y]
-            # type_trace[each_node] = type_
-            harmony.append([x, y])
-            type_trace.append(type_)
-        return harmony, type_trace
-        
-    def _cell_selection(self, min_valid):
+    def reseed(self, seed=None):
+        """
+            Give the search (and its objective function) a new random stream, seeded with seed when given
+        """
+        self.rng = RandomStream(seed)
+        self._obj_function.rng = self.rng
+
+    def close(self):
+        """
+            Release what the search holds outside itself: its handler on the summary logger, which is shared by
+            every HarmonySearch of the process, and the rendering process once the plots submitted are saved
+        """
+        path = os.path.abspath(os.path.join(self.log_dir, 'best_maximum_coverage_ratio.log'))
+        for handler in list(self.logger2.handlers):
+            if getattr(handler, "baseFilename", None) == path:
+                self.logger2.removeHandler(handler)
+                handler.close()
+        self.renderer.close()
+
+    def _node_bounds(self, n):
+        """
+            Bounds of the type drawn for every node of n harmonies, two (n x hmv x 2) arrays
+        """
+        types = self.rng.integers(self.ntypes, (n, self.hmv))
+        return np.asarray(self.lower, dtype=float)[types], np.asarray(self.upper, dtype=float)[types]
+
+    def _random_selection(self, n):
+        """
+            n harmonies with every node drawn uniformly within the bounds of a random type
+        """
+        lower, upper = self._node_bounds(n)
+        return lower + (upper - lower)*self.rng.random((n, self.hmv, 2))
+
+    def _cell_ids(self, n):
+        """
+            Cell (column, row) of every node of n harmonies, a random permutation of the first hmv cells per harmony
+        """
         num_width_cell = self.AoI[0] // self.cell_size[0]
-        num_height_cell = self.AoI[1] // self.cell_size[1]
-        # harmony = [[-1, -1]] * self.hmv
-        # type_trace = [random.choice(range(len(self.upper))) for i in range(self.hmv)]
-        # valid_nodes = random.sample(range(self.hmv), random.randrange(min_valid, num_width_cell*num_height_cell + 1))
-        # id_valid_cell = random.sample(range(num_width_cell*num_height_cell), len(valid_nodes))
-        id_valid_cell = list(range(self.hmv))
-        random.shuffle(id_valid_cell)
-        harmony = []
-        type_trace = []
-        for ids in range(self.hmv):
-            type_ = random.choice([0,1])
-            width_coor = id_valid_cell[ids] % num_width_cell
-            height_coor = id_valid_cell[ids] // num_width_cell
-            x = width_coor * self.cell_size[0] + self.cell_size[0]*random.random()
-            y = height_coor * self.cell_size[1] + self.cell_size[1]*random.random()
-            # harmony[each_node] = [x, y]
-            # type_trace[each_node] = type_
-            harmony.append([x, y])
-            type_trace.append(type_)
-        return harmony, type_trace
+        id_valid_cell = np.argsort(self.rng.random((n, self.hmv)), axis=1)
+        return np.stack([id_valid_cell % num_width_cell, id_valid_cell // num_width_cell], axis=-1)
+
+    def _centroid_selection(self, n):
+        """
+            n harmonies with one node at the center of each of hmv cells
+        """
+        return (self._cell_ids(n) + 0.5) * np.asarray(self.cell_size, dtype=float)
+
+    def _cell_selection(self, n):
+        """
+            n harmonies with one node anywhere in each of hmv cells
+        """
+        return (self._cell_ids(n) + self.rng.random((n, self.hmv, 2))) * np.asarray(self.cell_size, dtype=float)
+
+    def _opposition_selection(self, n):
+        """
+            n random harmonies followed by their n opposites, each node mirrored through the center of its type bounds
+        """
+        lower, upper = self._node_bounds(n)
+        harmonies = lower + (upper - lower)*self.rng.random((n, self.hmv, 2))
+        return np.concatenate([harmonies, lower + upper - harmonies])
+
+    def _latin_hypercube_selection(self, n):
+        """
+            n harmonies whose coordinates are stratified: along every node coordinate, each of the n harmonies falls
+            in a different one of n equal slices of the bounds
+        """
+        lower, upper = self._node_bounds(n)
+        strata = np.argsort(self.rng.random((self.hmv, 2, n)), axis=-1).transpose(2, 0, 1)
+        return lower + (upper - lower)*(strata + self.rng.random((n, self.hmv, 2))) / n
+
+    def _evaluate_initial(self, harmonies, types=None):
+        """
+            Score initial harmonies INIT_BLOCK at a time, return their fitness, coverage and type traces
+        """
+        fitness, coverage, traces = [], [], []
+        for block in range(0, len(harmonies), self.INIT_BLOCK):
+            chunk = slice(block, block + self.INIT_BLOCK)
+            f, c, t = self._obj_function.get_fitness_batch(harmonies[chunk], None if types is None else types[chunk])
+            fitness.append(f)
+            coverage.append(c)
+            traces.extend(t)
+        self.evaluations += len(harmonies)
+        return np.concatenate(fitness), np.concatenate(coverage), traces
+
+    def _warm_start(self, initial_harmonies):
+        """
+            Score (harmony, type_trace) pairs, the types of a pair with no type_trace are drawn by the objective function
+        """
+        harmonies = np.asarray([harmony for harmony, _ in initial_harmonies], dtype=float).reshape(-1, self.hmv, 2)
+        traced = np.asarray([type_trace is not None for _, type_trace in initial_harmonies], dtype=bool)
+        valid = (harmonies >= 0).all(axis=-1)
+        types = np.zeros(valid.shape, dtype=int)
+        for b in np.flatnonzero(traced):
+            assert len(initial_harmonies[b][1]) == valid[b].sum(), "Need one type per used node"
+            types[b, valid[b]] = initial_harmonies[b][1]
+
+        fitness, coverage = np.empty(len(harmonies)), np.empty(len(harmonies))
+        traces = [None] * len(harmonies)
+        for group, group_types in [(np.flatnonzero(traced), types), (np.flatnonzero(~traced), None)]:
+            if len(group):
+                f, c, t = self._evaluate_initial(harmonies[group], None if group_types is None else group_types[group])
+                fitness[group], coverage[group] = f, c
+                for b, trace in zip(group, t):
+                    traces[b] = trace
+        return harmonies, fitness, coverage, traces
 
     def _initialize_harmony(self, type = "default", min_valid=14, initial_harmonies=None):
         """
             Initialize harmony_memory, the matrix containing solution vectors (harmonies)
+            The harmonies of a strategy are generated as one array and scored with get_fitness_batch
+
+            :param type: "default", "centroid", "cell", "opposition" (the best hms of hms random harmonies and their
+                         opposites) or "lhs" (Latin hypercube)
+            :param initial_harmonies: (harmony, type_trace) pairs to start from, type_trace None to draw the types;
+                                      the best hms are kept and the remaining slots are filled with type
         """
-        if initial_harmonies is not None:
-            # assert len(initial_harmonies) == self._obj_function.get_hms(),\
-            #     "Size of harmony memory and objective function is not compatible"
-            # assert len(initial_harmonies[0]) == self._obj_function.get_num_parameters(),\
-            #     "Number of params in harmony memory and objective function is not compatible"
-            for each_harmony, type_trace in initial_harmonies:
-                self._harmony_memory.append((each_harmony, self._obj_function.get_fitness(each_harmony, type_trace)[0]))
-        else:
-            assert type in ["default", "centroid", "cell"], "Unknown type of initialization"
-            self._harmony_memory = []
-            if type == "default":
-                for _ in range(0, self._obj_function.get_hms()):
-                    harmony = self._random_selection(min_valid)
-                    fitness, type_trace = self._obj_function.get_fitness(harmony)
-                    self._harmony_memory.append((harmony, type_trace, fitness[0]))
-            elif type == "centroid":
-                for _ in range(0, self._obj_function.get_hms()):
-                    harmony, type_trace = self._centroid_selection(min_valid)
-                    fitness, type_trace = self._obj_function.get_fitness(harmony)
-                    self._harmony_memory.append((harmony, type_trace, fitness[0]))
-            elif type == "cell":
-                for _ in range(0, self._obj_function.get_hms()):
-                    harmony, type_trace = self._cell_selection(min_valid)
-                    fitness, type_trace = self._obj_function.get_fitness(harmony)
-                    self._harmony_memory.append((harmony, type_trace, fitness[0]))
-
-    def _memory_consideration(self):
+        assert type in self.INIT_STRATEGIES, "Unknown type of initialization"
+        self._harmony_memory = HarmonyMemory(self.hms, self.hmv)
+        self.archive = ParetoArchive(self.pareto_archive, self.hmv) if self.pareto_archive > 0 else None
+        self.evaluations = 0
+        pools = []
+        if initial_harmonies:
+            pools.append((self._warm_start(initial_harmonies), self.hms))
+        missing = self.hms - min(len(initial_harmonies or []), self.hms)
+        if missing > 0:
+            harmonies = getattr(self, self.INIT_STRATEGIES[type])(missing)
+            pools.append(((harmonies,) + self._evaluate_initial(harmonies), missing))
+
+        for (harmonies, fitness, coverage, traces), size in pools:
+            self._update_archive(harmonies, fitness, coverage, traces)
+            keep = np.arange(len(harmonies))
+            if len(harmonies) > size:
+                keep = np.sort(np.argsort(-fitness, kind="stable")[:size])
+            self._harmony_memory.extend(harmonies[keep], [traces[b] for b in keep], fitness[keep], coverage[keep])
+
+        if self._delta is not None:
+            for slot, (each_harmony, _, _) in enumerate(self._harmony_memory):
+                self._delta.store(slot, each_harmony)
+
+    def _memory_consideration(self, hmcr=None, par=None, bw=None):
         """
             Generate new harmony from previous harmonies in harmony memory
             Apply pitch adjustment with par probability
+            hmcr, par and bw default to the ones of the HarmonySearch
         """
+        hmcr = self.hmcr if hmcr is None else hmcr
+        par = self.par if par is None else par
+        bw = self.BW if bw is None else bw
         harmony = []
+        memory, ids = self._consideration_pool(self.hmv)
+        considered = memory[ids, np.arange(self.hmv)].tolist()
+        # Every draw of the harmony is taken up front, one slice per kind
+        p_hmcr = self.rng.random(self.hmv).tolist()
+        p_par = self.rng.random(self.hmv).tolist()
+        bw_rate = self.rng.uniform(-1, 1, (self.hmv, 2))
+        types = self.rng.integers(self.ntypes, self.hmv).tolist()
+        rates = self.rng.random((self.hmv, 2)).tolist()
         for i in range(self.hmv):
-            p_hmcr = random.random()
-            if p_hmcr < self.hmcr:
-                id = random.choice(range(self.hms))
-                [x, y] = self._harmony_memory[id][0][i]
-                [x, y] = self._pitch_adjustment([x, y])
+            if p_hmcr[i] < hmcr:
+                [x, y] = self._pitch_adjustment(considered[i], i, par, bw, p_par[i], bw_rate[i])
             else:
-                type_ = random.choice([0, 1])
-                if type_ == 0:
-                    x = self.lower[0][0] + (self.upper[0][0] - self.lower[0][0])*random.random()
-                    y = self.lower[0][1] + (self.upper[0][1] - self.lower[0][1])*random.random()
-                else:
-                    x = self.lower[1][0] + (self.upper[1][0] - self.lower[1][0])*random.random()
-                    y = self.lower[1][1] + (self.upper[1][1] - self.lower[1][1])*random.random()
-
-            if x > self.upper[1][0] or x < self.lower[0][0]:
+                type_ = types[i]
+                x = self.lower[type_][0] + (self.upper[type_][0] - self.lower[type_][0])*rates[i][0]
+                y = self.lower[type_][1] + (self.upper[type_][1] - self.lower[type_][1])*rates[i][1]
+
+            if x > self._high[0] or x < self._low[0]:
                 x = -1
-            if y > self.upper[1][1] or y < self.lower[0][1]:
+            if y > self._high[1] or y < self._low[1]:
                 y = -1
             harmony.append([x, y])
         
         return harmony
 
-    def _pitch_adjustment(self, position):
+    def _memory_consideration_batch(self, nSearch):
+        """
+            Vectorized _memory_consideration, generate nSearch harmonies as one (nSearch x hmv x 2) array
+            Also return the (nSearch x hmv) memory slot each node was copied from unchanged, -1 otherwise
         """
-            Adjustment for generating completely new harmony vectors
+        shape = (nSearch, self.hmv)
+        lower = np.asarray(self.lower, dtype=float)
+        upper = np.asarray(self.upper, dtype=float)
+
+        hmcr, par, bw = self.schedule.parameters(self, nSearch)
+        considered = self.rng.random(shape) < hmcr[:, None]
+        memory, ids = self._consideration_pool(shape)
+        harmonies = memory[ids, np.arange(self.hmv)]
+        adjusted = self.rng.random(shape) < par[:, None]
+        bw_rate = self.rng.uniform(-1, 1, shape + (2,))
+        harmonies = np.where(adjusted[..., None], self.schedule.adjust(self, harmonies, bw[:, None, :]*bw_rate, np.arange(self.hmv)),
+                             harmonies)
+
+        type_ = self.rng.integers(self.ntypes, shape)
+        random_harmonies = lower[type_] + (upper[type_] - lower[type_])*self.rng.random(shape + (2,))
+        harmonies = np.where(considered[..., None], harmonies, random_harmonies)
+
+        harmonies[(harmonies > self._high) | (harmonies < self._low)] = -1
+        # Nodes copied from the archive have no memory slot
+        sources = np.where(considered & ~adjusted & (ids < self.hms), ids, -1)
+        return harmonies, sources
+
+    def _consideration_pool(self, shape):
+        """
+            Harmonies memory consideration copies nodes from (the memory, followed by the archive entries in Pareto mode)
+            and the index of the harmony each of shape nodes is copied from
+        """
+        memory = self._harmony_memory.positions
+        if self.archive is None or not len(self.archive):
+            return memory, self.rng.integers(self.hms, shape)
+        memory = np.concatenate([memory, self.archive.positions()])
+        # Drawn from uniforms, the pool size changes with the archive
+        return memory, np.minimum((self.rng.random(shape) * len(memory)).astype(int), len(memory) - 1)
+
+    def _update_archive(self, harmonies, fitness, coverage, type_traces):
         """
-        p_par = random.random()
-        if p_par < self.par:
-            bw_rate = random.uniform(-1,1)
-            position[0] = self.BW*bw_rate + position[0]
-            position[1] = self.BW*bw_rate + position[1]
+            Offer evaluated harmonies to the Pareto archive, rejected ones (fitness -inf) excluded
+        """
+        if self.archive is None:
+            return
+        t = self.stats.tic()
+        weights = self._obj_function.model.weights
+        for b in np.flatnonzero(np.isfinite(fitness)):
+            harmony = np.asarray(harmonies[b], dtype=float)
+            valid = (harmony >= 0).all(axis=1)
+            types = np.full(self.hmv, -1)
+            types[valid] = type_traces[b]
+            self.archive.add(coverage[b], weights[types[valid]].sum(), harmony, types, fitness[b])
+        self.stats.toc("archive", t, len(fitness))
+
+    def _pitch_adjustment(self, position, node=0, par=None, bw=None, p_par=None, bw_rate=None):
+        """
+            Adjustment for generating completely new harmony vectors, x and y get their own bandwidth rate
+            p_par and the (x, y) bw_rate are drawn from the random stream when not given
+        """
+        par = self.par if par is None else par
+        bw = self.BW if bw is None else bw
+        p_par = self.rng.random() if p_par is None else p_par
+        if p_par < par:
+            bw_rate = self.rng.uniform(-1, 1, 2) if bw_rate is None else bw_rate
+            position = self.schedule.adjust(self, np.asarray(position, dtype=float), np.asarray(bw)*bw_rate, node).tolist()
         return position
 
-    def _new_harmony_consideration(self, harmony, fitness, type_trace):
+    def _new_harmony_consideration(self, harmony, fitness, type_trace, coverage=0.0):
         """
             Update harmony memory
         """
         # (fitness, _), type_trace = self._obj_function.get_fitness(harmony)
-        
-        worst_fitness = float("+inf")
-        worst_ind = -1
-        best_fitness = float("-inf")
-        best_ind = -1
-        for ind, (_, _x, each_fitness) in enumerate(self._harmony_memory):
-            if each_fitness < worst_fitness:
-                worst_fitness = each_fitness
-                worst_ind = ind
-            
-            if each_fitness > best_fitness:
-                best_fitness = each_fitness
-                best_ind = ind
-        
-        if fitness >= worst_fitness:
-            self._harmony_memory[worst_ind] = (harmony, type_trace, fitness)
-        
+
+        t = self.stats.tic()
+        worst_ind = self._harmony_memory.worst()
+        if fitness >= self._harmony_memory.fitness[worst_ind]:
+            self._harmony_memory.set(worst_ind, harmony, type_trace, fitness, coverage)
+            if self._delta is not None:
+                self._delta.store(worst_ind, harmony)
+            self.stats.count("accepted")
+
+        best_ind = self._harmony_memory.best()
+        self.stats.toc("_new_harmony_consideration", t)
         return best_ind
 
+    def get_stats(self):
+        """
+            Phase timings, evaluations/sec and accepted replacement rate of the current (or last) run
+        """
+        stats = self.stats.summary()
+        if self._obj_function.cache is not None:
+            stats["cache"] = self._obj_function.cache.stats()
+        return stats
+
     def _get_best_fitness(self):
         """
             Gest best fitness and corresponding harmony vector in harmony memory
         """
-        best_fitness = float("-inf")
-        best_harmony = []
-        for each_harmony, type_trace, each_fitness in self._harmony_memory:
-            if each_fitness > best_fitness:
-                best_fitness = each_fitness
-                best_harmony = each_harmony
-                type_ = type_trace
-        return best_harmony, type_, best_fitness
-
-    def _get_best_coverage_ratio(self):
-        best_harmony, type_trace = self._get_best_fitness()[0:2]
-        (_, coverage_ratio), _ = self._obj_function.get_fitness(best_harmony)
-        return coverage_ratio
-
-    def _evaluation(self, threshold):
-        coverage_ratio = self._get_best_coverage_ratio()
-        best_harmony, type_, best_fitness = self._get_best_fitness()
-        if coverage_ratio > self.best_coverage and coverage_ratio >= threshold:
-            self.logger.info(f"Pos: {str(best_harmony)}\nType: {str(type_)}\nCoverage: {str(coverage_ratio)}")
-            self.best_coverage = coverage_ratio
-            self.logger.info("This harmony is sastified")
-        elif coverage_ratio >= threshold:
-            self.logger.info(f"Pos: {str(best_harmony)}\nType: {str(type_)}\nCoverage: {str(coverage_ratio)}")
-            self.logger.info("This harmony is sastified")
-        elif coverage_ratio > self.best_coverage:
-            self.logger.info(f"Pos: {str(best_harmony)}\nType: {str(type_)}\nCoverage: {str(coverage_ratio)}")
-            self.best_coverage = coverage_ratio
-        return False
+        return self._harmony_memory[self._harmony_memory.best()]
 
     def _count_sensor(self, harmony):
         count_ = 0
@@ -246,39 +396,216 @@ class HarmonySearch():
         return count_
     
     def _search(self, nSearch):
+        if self.batch_eval:
+            return self._search_batch(nSearch)
+
         bestharmony = None 
         besttrace = None
         best = float('-inf')
+        bestcoverage = 0
         
+        self.evaluations += nSearch
+        self.stats.count("evaluations", nSearch)
+        hmcr, par, bw = self.schedule.parameters(self, nSearch)
         for i in range(nSearch):
-            candidate_harmony = self._memory_consideration()
-            (candidatefitness, _), type_trace = self._obj_function.get_fitness(candidate_harmony)
+            t = self.stats.tic()
+            candidate_harmony = self._memory_consideration(hmcr[i], par[i], bw[i])
+            t = self.stats.toc("_memory_consideration", t)
+            (candidatefitness, candidatecoverage), type_trace = self._obj_function.get_fitness(candidate_harmony)
+            self.stats.toc("get_fitness", t)
+            self._update_archive([candidate_harmony], [candidatefitness], [candidatecoverage], [type_trace])
             if candidatefitness > best:
                 best=candidatefitness
                 bestharmony = candidate_harmony
                 besttrace=type_trace
+                bestcoverage = candidatecoverage
+                self._chosen = i
         
-        return bestharmony, best, besttrace
+        return bestharmony, best, besttrace, bestcoverage
+
+    def _search_batch(self, nSearch):
+        """
+            Batched _search, all candidates are scored in one get_fitness_batch call
+        """
+        self.evaluations += nSearch
+        self.stats.count("evaluations", nSearch)
+        t = self.stats.tic()
+        candidates, sources = self._memory_consideration_batch(nSearch)
+        t = self.stats.toc("_memory_consideration", t, nSearch)
+        if self._delta is not None:
+            fitness, coverage, type_traces = self._delta.get_fitness_batch(candidates, sources)
+        else:
+            fitness, coverage, type_traces = self._obj_function.get_fitness_batch(candidates)
+        self.stats.toc("get_fitness", t, nSearch)
+        self._update_archive(candidates, fitness, coverage, type_traces)
+        best = int(np.argmax(fitness))
+        self._chosen = best
+        return candidates[best].tolist(), float(fitness[best]), type_traces[best], float(coverage[best])
     
-    def run(self, type_init="default", min_valid=14,steps=100, threshold=0.9,order=0, logger=None):
-        
-        print("Start run:")
-        self._initialize_harmony(type_init, min_valid)
+    def run(self, type_init="default", min_valid=14,steps=100, threshold=0.9,order=0, logger=None, seed=None, initial_harmonies=None):
+        """
+            One optimization, reported and plotted; the plot is rendered in the background, call close() after the
+            last run to wait for it and shut the rendering process down
+        """
+        result = self._run(type_init, min_valid, steps, threshold, order, logger, seed, initial_harmonies=initial_harmonies)
+        self._report_run(result)
+        self._plot(result, order)
+        return result["fitness"], result["coverage"], result["used"], result["used_convert"]
 
-        best_ind = -1
-        for i in tqdm(range(steps)):
-            # new_harmony = self._memory_consideration()
-            new_harmony, new_fitness, new_trace = self._search(10)
+    def _run(self, type_init="default", min_valid=14, steps=100, threshold=0.9, order=0, logger=None, seed=None, progress=True,
+             initial_harmonies=None):
+        """
+            One optimization, seeded with seed when given, starting from initial_harmonies when given
+            (see _initialize_harmony)
 
-            new_best_ind = self._new_harmony_consideration(new_harmony, new_fitness, new_trace)
+            :param threshold: unused, kept for compatibility; a run stops on a coverage through TargetCoverage
+        """
+        checkpointer = None
+        if self.checkpoint_interval > 0 or self.resume:
+            checkpointer = Checkpointer(self.checkpoint_dir, self.checkpoint_interval)
+        state = None
+        if self.resume:
+            result = checkpointer.load_result(order)
+            if result is not None:
+                print("Run {} already finished".format(order))
+                checkpointer.close()
+                return result
+            state = checkpointer.load(order)
+
+        print("Start run:")
+        if state is not None:
+            seed, start, best_ind = self._restore(state)
+            print("Resume from step {}".format(start))
+        else:
+            self.reseed(seed)
+            self._initialize_harmony(type_init, min_valid, initial_harmonies)
+            start, best_ind = 0, -1
+            self.best_coverage = 0
+
+        self.stats.reset()
+        self.schedule.start(self, steps, start)
+        for criterion in self.stopping:
+            criterion.start(self, start)
+        stop_reason, last_step = "steps", steps - 1
+        profiler = cProfile.Profile() if self.profile_steps is not None else None
+        recorder = ConvergenceRecorder(os.path.join(self.log_dir, 'convergence{}.csv'.format(order)), every=self.trace_every,
+                                       snapshots=self.trace_snapshots, logger=logger if self.text_log else None)
+        for i in tqdm(range(start, steps), initial=start, total=steps, disable=not progress):
+            if profiler is not None and i == self.profile_steps[0]:
+                profiler.enable()
+            new_best_ind = self._step()
+            if profiler is not None and i + 1 == self.profile_steps[1]:
+                profiler.disable()
 
-            best_harmony, best_type, best_fitness = self._harmony_memory[best_ind]
-            
             if new_best_ind != best_ind:
                 best_ind = new_best_ind
-                logger.info(f'Step: {str(i)} Best harmony: {str(best_harmony)} Type: {str(best_type)} Best_fitness: {str(best_fitness)}')
-                logger.info('------------------------------------------------------------------------------------')
+                self.best_coverage = float(self._harmony_memory.coverage[best_ind])
+                t = self.stats.tic()
+                self._record(recorder, i, best_ind)
+                self.stats.toc("logging", t)
+
+            if checkpointer is not None and checkpointer.due(i):
+                t = self.stats.tic()
+                recorder.flush()
+                checkpointer.save(order, self._checkpoint_state(i + 1, best_ind, seed))
+                self.stats.toc("checkpoint", t)
+
+            reason = self._should_stop(i, best_ind)
+            if reason is not None:
+                stop_reason, last_step = reason, i
+                break
+
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(self.log_dir, 'profile{}.prof'.format(order)))
+        t = self.stats.tic()
+        self._record(recorder, last_step, best_ind, force=True)
+        recorder.close()
+        self.stats.toc("logging", t)
+
+        result = self._summarize(best_ind)
+        result["seed"] = seed
+        result["stop_reason"] = stop_reason
+        result["stop_step"] = last_step + 1
+        if self.archive is not None:
+            result["front"] = self.archive.front()
+            self.archive.save(os.path.join(self.log_dir, 'front{}.csv'.format(order)))
+        if self.stats.enabled:
+            self.stats.dump(os.path.join(self.log_dir, 'stats{}.json'.format(order)), self.get_stats())
+        if checkpointer is not None:
+            checkpointer.save_result(order, result)
+            checkpointer.close()
+        return result
+
+    def _should_stop(self, step, best_ind):
+        """
+            Reason of the first stopping criterion met after step, None to go on
+        """
+        for criterion in self.stopping:
+            if criterion.check(self, step, best_ind):
+                return criterion.reason
+        return None
+
+    def _record(self, recorder, step, best_ind, force=False):
+        """
+            Add the harmony at best_ind to the convergence trace
+        """
+        memory = self._harmony_memory
+        sensors = np.count_nonzero((memory.positions[best_ind] >= 0).all(axis=1))
+        recorder.record(step, self.evaluations, memory.fitness[best_ind], memory.coverage[best_ind], sensors,
+                        memory.positions[best_ind], memory.types[best_ind], force=force)
+
+    def _checkpoint_state(self, step, best_ind, seed):
+        """
+            Everything needed to continue a run from step
+        """
+        state = {"step": step, "best_ind": best_ind, "seed": -1 if seed is None else seed,
+                 "best_coverage": self.best_coverage, "positions": self._harmony_memory.positions,
+                 "types": self._harmony_memory.types, "fitness": self._harmony_memory.fitness,
+                 "coverage": self._harmony_memory.coverage, "size": self._harmony_memory.size,
+                 "evaluations": self.evaluations}
+        state.update(self.rng.state())
+        if self.archive is not None:
+            state.update(self.archive.state())
+        return state
 
+    def _restore(self, state):
+        """
+            Load a checkpoint written by _checkpoint_state, return the seed, step and best index it holds
+        """
+        self._harmony_memory = HarmonyMemory(self.hms, self.hmv)
+        self._harmony_memory.restore(state["positions"], state["types"], state["fitness"], state["coverage"], state["size"])
+        self.evaluations = int(state["evaluations"])
+        if self._delta is not None:
+            for slot, (each_harmony, _, _) in enumerate(self._harmony_memory):
+                self._delta.store(slot, each_harmony)
+        self.best_coverage = float(state["best_coverage"])
+        self.archive = ParetoArchive(self.pareto_archive, self.hmv) if self.pareto_archive > 0 else None
+        if self.archive is not None and "front_values" in state:
+            self.archive.restore(state)
+        self.reseed()
+        self.rng.restore(state)
+        seed = int(state["seed"])
+        return (None if seed < 0 else seed), int(state["step"]), int(state["best_ind"])
+
+    def _step(self):
+        """
+            One improvisation: search a block of candidates and update the harmony memory with the best one
+            Return the index of the best harmony in memory
+        """
+        # new_harmony = self._memory_consideration()
+        self.stats.count("steps")
+        self.schedule.update(self)
+        new_harmony, new_fitness, new_trace, new_coverage = self._search(self.n_search)
+        accepted = new_fitness >= self._harmony_memory.fitness[self._harmony_memory.worst()]
+        best_ind = self._new_harmony_consideration(new_harmony, new_fitness, new_trace, new_coverage)
+        self.schedule.feedback(self, self._chosen, accepted)
+        return best_ind
+
+    def _summarize(self, best_ind):
+        """
+            Coverage and sensor counts of the harmony stored at best_ind
+        """
         best_harmony, best_type, best_fitness = self._harmony_memory[best_ind]
         
    
@@ -287,48 +614,127 @@ class HarmonySearch():
         for ind, node in enumerate(best_harmony):
             if node[0] > 0 and node[1] > 0:
                 used_node.append(node)
-        coverage = self._obj_function.get_coverage_ratio(used_node, type_trace)
+        coverage = float(self._harmony_memory.coverage[best_ind])
         no_used = len(used_node)
-        no_used_convert = sum(type_trace) + (len(type_trace)-sum(type_trace))/2
+        no_used_convert = float(self._obj_function.model.weights[np.asarray(type_trace, dtype=int)].sum())
 
-        draw(used_node, type_trace, os.path.join(self.image_dir, './fig{}.png'.format(str(order))))
+        return {"harmony": best_harmony, "type": type_trace, "fitness": best_fitness, "used_node": used_node,
+                "coverage": coverage, "used": no_used, "used_convert": no_used_convert}
 
-        # save the best for1 runs
-        self.logger2.info(f'Best harmony: {str(best_harmony)}\nType: {str(type_trace)}\nBest_fitness: {str(best_fitness)}\nCoressponding coverage: {str(coverage)} \nCoressponding sensors: {str(no_used)} and {str(no_used_convert)}')
+    def _plot(self, result, order):
+        """
+            Hand the best deployment of run order to the renderer, run and test never wait for the figure
+        """
+        self.renderer.submit(result["used_node"], result["type"], os.path.join(self.image_dir, 'fig{}.png'.format(order)))
+
+    def _report_run(self, result):
+        """
+            Save the best of one run
+        """
+        if result["seed"] is not None:
+            self.logger2.info(f'Seed: {str(result["seed"])}')
+        if "stop_reason" in result:
+            self.logger2.info(f'Stopped by: {result["stop_reason"]} at step {result["stop_step"]}')
+        if result.get("front"):
+            self.logger2.info(f'Front: {len(result["front"])} harmonies, coverage {result["front"][0]["coverage"]} to '
+                              f'{result["front"][-1]["coverage"]}, cost {result["front"][0]["cost"]} to {result["front"][-1]["cost"]}')
+        self.logger2.info(f'Best harmony: {str(result["harmony"])}\nType: {str(result["type"])}\nBest_fitness: {str(result["fitness"])}\nCoressponding coverage: {str(result["coverage"])} \nCoressponding sensors: {str(result["used"])} and {str(result["used_convert"])}')
         self.logger2.info('------------------------------------------------------------------------------------')
-        
-        
-        
-        return best_fitness, coverage, no_used, no_used_convert
-    
-    def test(self, type_init="default", min_valid=14, steps=60000, threshold=0.9, file='logging.txt', num_run=12):
-        coverage = []
-        fitness = []
-        used = []
-        cost = []
-        corr = []
-        for i in range(num_run):
-            logger = logging.getLogger(name='harmony{}'.format(str(i)))
-            logger.setLevel(logging.INFO)
-            handler = logging.FileHandler(os.path.join(self.log_dir, "output{}.log".format(i)))
-            handler.setLevel(logging.INFO)
-            formatter = logging.Formatter('%(levelname)s: %(message)s')
-            handler.setFormatter(formatter)
-            logger.addHandler(handler)
-            
-            ifitness, icover, iused, iusedconvert = self.run(type_init, min_valid, steps, threshold, i, logger)
-            
-            coverage.append(icover)
-            fitness.append(ifitness)
-            used.append(iused)
-            corr.append(iusedconvert/25)
-            cost.append(icover - iusedconvert/25)
-        
+
+    def _run_logger(self, order):
+        logger = logging.getLogger(name='harmony{}'.format(str(order)))
+        logger.setLevel(logging.INFO)
+        # Handlers left by a previous run with this order (or inherited by a forked worker) would duplicate the log
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        handler = logging.FileHandler(os.path.join(self.log_dir, "output{}.log".format(order)))
+        handler.setLevel(logging.INFO)
+        formatter = logging.Formatter('%(levelname)s: %(message)s')
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+        return logger
+
+    def test(self, type_init="default", min_valid=14, steps=60000, threshold=0.9, file='logging.txt', num_run=12, workers=1, seeds=None,
+             initial_harmonies=None):
+        """
+            Run num_run independent optimizations and log the mean/std of their results
+
+            :param threshold: unused, see _run
+            :param workers: number of processes the runs are spread over, 1 runs them one after another
+            :param seeds: seed of each run, drawn at random and logged when not given
+            :param initial_harmonies: (harmony, type_trace) pairs every run starts from
+        """
+        if seeds is None:
+            seeds = [random.randrange(2**32) for _ in range(num_run)]
+        assert len(seeds) == num_run, "Need one seed per run"
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                jobs = [executor.submit(_run_worker, self, type_init, min_valid, steps, threshold, i, seeds[i], initial_harmonies)
+                        for i in range(num_run)]
+                results = [job.result() for job in jobs]
+        else:
+            results = (self._run(type_init, min_valid, steps, threshold, i, self._run_logger(i), seeds[i],
+                                 initial_harmonies=initial_harmonies) for i in range(num_run))
+
+        reported = []
+        for order, result in enumerate(results):
+            self._report_run(result)
+            self._plot(result, order)
+            reported.append(result)
+        summary, stop_reasons = summarize_runs(reported, self.hmv)
 
         self.logger2.info('------------------------------------------------------------------------------------') 
         self.logger2.info('------------------------------------------------------------------------------------') 
-        self.logger2.info(f'Coverage mean, std : {str(np.mean(coverage))} and {str(np.std(coverage))}')
-        self.logger2.info(f'Used mean, std : {str(np.mean(used))} and {str(np.std(used))}')
-        self.logger2.info(f'Corr Used mean, std : {str(np.mean(corr))} and {str(np.std(corr))}')
-        self.logger2.info(f'Cost mean, std : {str(np.mean(cost))} and {str(np.std(cost))}')
-        self.logger2.info(f'Fitness mean, std : {str(np.mean(fitness))} and {str(np.std(fitness))}')
\ No newline at end of file
+        for name, label in [("coverage", "Coverage"), ("used", "Used"), ("corr", "Corr Used"), ("cost", "Cost"),
+                            ("fitness", "Fitness"), ("stop_step", "Stop step")]:
+            if name in summary:
+                self.logger2.info(f'{label} mean, std : {str(summary[name][0])} and {str(summary[name][1])}')
+        if stop_reasons:
+            self.logger2.info(f'Stop reasons : {str(stop_reasons)}')
+        if self.pareto_archive > 0:
+            # Front of all runs together
+            archive = ParetoArchive(self.pareto_archive, self.hmv)
+            for result in reported:
+                for entry in result.get("front", []):
+                    harmony = np.asarray(entry["harmony"], dtype=float)
+                    types = np.full(self.hmv, -1)
+                    types[(harmony >= 0).all(axis=1)] = entry["type"]
+                    archive.add(entry["coverage"], entry["cost"], harmony, types, entry["fitness"])
+            archive.save(os.path.join(self.log_dir, 'front.csv'))
+            self.logger2.info(f'Front size : {len(archive)}')
+        # Deferred plots are rendered here, once every run is over, and the rendering process is shut down before
+        # the interpreter exits (a pool left to its atexit hook may fail on closed descriptors)
+        self.renderer.close()
+
+
+def summarize_runs(results, hmv):
+    """
+        Mean and std over runs of the metrics test logs, results as returned by _run
+        :param hmv: number of nodes of the harmonies, the sensor weights are normalized by it
+        :return: {metric: (mean, std)} and the number of runs ended by each stop reason
+    """
+    metrics = {"coverage": [], "used": [], "corr": [], "cost": [], "fitness": []}
+    stop_steps = []
+    stop_reasons = {}
+    for result in results:
+        metrics["coverage"].append(result["coverage"])
+        metrics["fitness"].append(result["fitness"])
+        metrics["used"].append(result["used"])
+        metrics["corr"].append(result["used_convert"]/hmv)
+        metrics["cost"].append(result["coverage"] - result["used_convert"]/hmv)
+        if "stop_reason" in result:
+            stop_steps.append(result["stop_step"])
+            stop_reasons[result["stop_reason"]] = stop_reasons.get(result["stop_reason"], 0) + 1
+    if stop_steps:
+        metrics["stop_step"] = stop_steps
+    return {name: (float(np.mean(values)), float(np.std(values))) for name, values in metrics.items()}, stop_reasons
+
+
+def _run_worker(hsa, type_init, min_valid, steps, threshold, order, seed, initial_harmonies=None):
+    """
+        Entry point of one run in a worker process, with its own log file
+    """
+    return hsa._run(type_init, min_valid, steps, threshold, order, hsa._run_logger(order), seed, progress=False,
+                    initial_harmonies=initial_harmonies)
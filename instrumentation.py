@@ -0,0 +1,54 @@
+import json
+import time
+
+
+class Instrumentation():
+    def __init__(self, enabled=True):
+        """
+            Cumulative wall time and call count per phase of the search loop, plus event counters.
+            When disabled tic/toc/count do nothing but return.
+
+            :param enabled: collect timings
+        """
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+
+    def tic(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def toc(self, phase, start, calls=1):
+        """
+            Add the time since start to phase, return the current time so phases can be chained
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + now - start
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+        return now
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        wall = time.perf_counter() - self._start
+        phases = {phase: {"seconds": self.seconds[phase], "calls": self.calls[phase],
+                          "mean": self.seconds[phase] / max(self.calls[phase], 1),
+                          "share": self.seconds[phase] / wall if wall > 0 else 0.0}
+                  for phase in self.seconds}
+        evaluations = self.counters.get("evaluations", 0)
+        steps = self.counters.get("steps", 0)
+        return {"wall": wall, "phases": phases, "counters": dict(self.counters),
+                "evaluations_per_sec": evaluations / wall if wall > 0 else 0.0,
+                "acceptance_rate": self.counters.get("accepted", 0) / steps if steps else 0.0}
+
+    def dump(self, path, summary=None):
+        with open(path, 'w') as f:
+            json.dump(self.summary() if summary is None else summary, f, indent=1)
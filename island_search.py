@@ -0,0 +1,187 @@
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class IslandHarmonySearch():
+    # Seconds between two checks that every island is still alive
+    POLL_SECONDS = 1
+
+    def __init__(self, harmony_search, islands=4, migration_interval=100, migration_size=2, topology="ring"):
+        """
+            Island model on top of HarmonySearch: every island evolves its own harmony memory in a separate
+            process and sends its best harmonies to its neighbours every migration_interval steps
+
+            :param harmony_search: HarmonySearch each island runs a copy of
+            :param islands: number of islands (worker processes)
+            :param migration_interval: number of steps between two migrations
+            :param migration_size: number of harmonies each island sends per migration
+            :param topology: "ring" sends to the next island, "full" to every other island
+        """
+        assert topology in ["ring", "full"], "Unknown migration topology"
+        assert migration_size <= harmony_search.hms, "Cannot migrate more harmonies than the memory holds"
+        # Islands step their memories directly, outside HarmonySearch._run
+        assert not harmony_search.stopping, "Islands run for a fixed number of steps, without stopping criteria"
+        assert harmony_search.checkpoint_interval == 0 and not harmony_search.resume, "Islands cannot be checkpointed"
+        self.hsa = harmony_search
+        self.islands = islands
+        self.migration_interval = migration_interval
+        self.migration_size = migration_size
+        self.topology = topology
+
+        self.logger = logging.getLogger(name='island')
+        self.logger.setLevel(logging.INFO)
+        handler = logging.FileHandler(os.path.join(self.hsa.log_dir, 'island.log'))
+        handler.setLevel(logging.INFO)
+        handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+        self.logger.addHandler(handler)
+
+    def close(self):
+        """
+            Remove the handler of this island model from the island logger, which is shared by the whole process
+        """
+        path = os.path.abspath(os.path.join(self.hsa.log_dir, 'island.log'))
+        for handler in list(self.logger.handlers):
+            if getattr(handler, "baseFilename", None) == path:
+                self.logger.removeHandler(handler)
+                handler.close()
+
+    def _neighbours(self, island):
+        """
+            Islands whose migrants island receives
+        """
+        if self.topology == "ring":
+            return [(island - 1) % self.islands]
+        return [other for other in range(self.islands) if other != island]
+
+    def run(self, type_init="default", min_valid=14, steps=1000, seeds=None):
+        """
+            Evolve all islands for steps steps each
+
+            :param seeds: seed of each island, drawn at random and logged when not given
+            :return: result of the best island as in HarmonySearch._run, with the history of
+                     (elapsed seconds, step, global best fitness) under "history"; it is also reported and plotted
+                     like a run of HarmonySearch.test
+            :raises RuntimeError: when an island process dies, the other islands are stopped
+        """
+        if seeds is None:
+            seeds = [random.randrange(2**32) for _ in range(self.islands)]
+        assert len(seeds) == self.islands, "Need one seed per island"
+
+        # One outbox per island, every island writes its migrants there and reads its neighbours'
+        size, hmv = self.migration_size, self.hsa.hmv
+        buffers = [shared_memory.SharedMemory(create=True, size=self.islands*size*hmv*2*8),
+                   shared_memory.SharedMemory(create=True, size=self.islands*size*hmv*8),
+                   shared_memory.SharedMemory(create=True, size=self.islands*size*8),
+                   shared_memory.SharedMemory(create=True, size=self.islands*size*8)]
+        context = multiprocessing.get_context()
+        barrier = context.Barrier(self.islands)
+        progress = context.Queue()
+        workers = [context.Process(target=_island_worker,
+                                   args=(self, island, seeds[island], type_init, min_valid, steps,
+                                         [buffer.name for buffer in buffers], barrier, progress))
+                   for island in range(self.islands)]
+
+        start = time.time()
+        try:
+            for worker in workers:
+                worker.start()
+
+            history = []
+            finals = {}
+            global_best = float('-inf')
+            while len(finals) < self.islands:
+                try:
+                    record = progress.get(timeout=self.POLL_SECONDS)
+                except queue.Empty:
+                    # An island that died (exception, killed) never reaches the barrier again, release the others
+                    failed = [island for island, worker in enumerate(workers) if worker.exitcode not in [None, 0]]
+                    if failed:
+                        barrier.abort()
+                        raise RuntimeError("Island {} exited with code {}".format(failed[0], workers[failed[0]].exitcode))
+                    continue
+                if record["final"]:
+                    finals[record["island"]] = record
+                    continue
+                global_best = max(global_best, record["fitness"])
+                elapsed = time.time() - start
+                history.append((elapsed, record["step"], global_best))
+                self.logger.info(f'Island: {record["island"]} Step: {record["step"]} Steps/sec: {record["speed"]:.1f} '
+                                 f'Best_fitness: {record["fitness"]} Coverage: {record["coverage"]} '
+                                 f'Global_best: {global_best} Time: {elapsed:.2f}')
+
+            for worker in workers:
+                worker.join()
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+            for buffer in buffers:
+                buffer.close()
+                buffer.unlink()
+
+        best = max(finals.values(), key=lambda record: record["fitness"])
+        self.logger.info(f'Seeds: {str(seeds)}')
+        self.logger.info(f'Best island: {best["island"]} Best_fitness: {best["fitness"]} Coverage: {best["coverage"]} '
+                         f'Time: {time.time() - start:.2f}')
+        best["history"] = history
+        self.hsa._report_run(best)
+        self.hsa._plot(best, 0)
+        self.hsa.renderer.flush()
+        return best
+
+
+def _island_worker(island_search, island, seed, type_init, min_valid, steps, buffer_names, barrier, progress):
+    """
+        Evolve one island and exchange migrants through the shared outboxes
+    """
+    hsa = island_search.hsa
+    size, hmv, islands = island_search.migration_size, hsa.hmv, island_search.islands
+    buffers = [shared_memory.SharedMemory(name=name) for name in buffer_names]
+    positions = np.ndarray((islands, size, hmv, 2), dtype=np.float64, buffer=buffers[0].buf)
+    types = np.ndarray((islands, size, hmv), dtype=np.int64, buffer=buffers[1].buf)
+    fitness = np.ndarray((islands, size), dtype=np.float64, buffer=buffers[2].buf)
+    coverage = np.ndarray((islands, size), dtype=np.float64, buffer=buffers[3].buf)
+
+    hsa.reseed(seed)
+    hsa._initialize_harmony(type_init, min_valid)
+    hsa.schedule.start(hsa, steps)
+    memory = hsa._harmony_memory
+
+    best_ind = memory.best()
+    start = time.time()
+    for step in range(steps):
+        best_ind = hsa._step()
+
+        if (step + 1) % island_search.migration_interval == 0 or step + 1 == steps:
+            top = memory.top(size)
+            positions[island] = memory.positions[top]
+            types[island] = memory.types[top]
+            fitness[island] = memory.fitness[top]
+            coverage[island] = memory.coverage[top]
+            barrier.wait()
+            for other in island_search._neighbours(island):
+                for k in range(size):
+                    trace = types[other, k][types[other, k] >= 0].tolist()
+                    best_ind = hsa._new_harmony_consideration(positions[other, k].tolist(), float(fitness[other, k]), trace,
+                                                              float(coverage[other, k]))
+            # Nobody overwrites its outbox before every island has read it
+            barrier.wait()
+
+            summary = hsa._summarize(best_ind)
+            progress.put({"final": False, "island": island, "step": step + 1, "speed": (step + 1) / (time.time() - start),
+                          "fitness": summary["fitness"], "coverage": summary["coverage"]})
+
+    del positions, types, fitness, coverage
+    for buffer in buffers:
+        buffer.close()
+
+    summary = hsa._summarize(best_ind)
+    summary.update({"final": True, "island": island, "seed": seed, "steps": steps, "time": time.time() - start})
+    progress.put(summary)
@@ -1,23 +1,51 @@
 import math
 from itertools import product
-import random
 import numpy as np
+from spatial import GridIndex, close_pairs
+from fitness_cache import FitnessCache
+from sensor_model import SensorModel
+from targets import open_targets
+from random_stream import RandomStream
 
 
 class ObjectiveFunction():
+    INDEX_MIN_TARGETS = 64
+    NEIGHBOR_MIN_SENSORS = 64
+    # Bytes of temporaries per sensor-target entry of the dense path and per harmony-target cell of the indexed path
+    DENSE_BYTES = 48
+    INDEXED_BYTES = 24
+
     def __init__(self, hmv, hms, targets, types=2, radius=[0,0], alpha1=1, alpha2=0, beta1=1, beta2=0.5,\
-                threshold=0.9, w=50, h=50, cell_h=10, cell_w=10):
+                threshold=0.9, w=50, h=50, cell_h=10, cell_w=10, engine="numpy",\
+                spatial_index=None, cache_size=0, cache_step=1e-6, type_samples=1, type_refine=0,\
+                psm_resolution=0, psm_interpolation="linear", memory_budget=None):
         """
             :param hmv: harmony vector size
             :param hms: harmony memory size
-            :param targets: position of target points
+            :param targets: position of target points, or the path of a float32 .npy file (see targets.save_targets)
+                            that is memory-mapped
             :param types: number of different node types
             :param radius: radius for each node type
             :param alpha1, alpha2, beta1, beta2: parameter for calculating Pov
             :param threshold: threshold for Pov
             :param h, w: height and width of AoI
             :param cell_h, cell_w: height and width of cell
+            :param engine: "numpy" for the array-based evaluation, "python" for the scalar reference path
+            :param spatial_index: only visit the targets in range of each sensor through a bucket grid over the targets,
+                                  None to enable it when there are more than INDEX_MIN_TARGETS targets
+            :param cache_size: number of evaluations kept in an LRU cache in front of get_fitness, 0 to disable
+            :param cache_step: quantization step of the sensor positions in the cache keys
+            :param type_samples: number of random type traces scored per harmony, the best one is kept
+            :param type_refine: max number of greedy single-sensor type flips applied to the best sampled trace
+            :param psm_resolution: number of samples per type of the PSM lookup tables, 0 to compute the PSM exactly
+            :param psm_interpolation: "linear" or "nearest" PSM table lookup
+            :param memory_budget: bytes of temporaries a coverage evaluation may use, the targets are then processed
+                                  in chunks that fit; None evaluates all targets at once
         """
+        assert engine in ["numpy", "python"], "Unknown evaluation engine"
+        assert types == len(radius), "Need one radius per node type"
+        if isinstance(targets, str):
+            targets = open_targets(targets)
         self.hmv = hmv
         self.hms = hms
         self.targets = targets
@@ -39,10 +67,30 @@ class ObjectiveFunction():
         self.cell_w = cell_w
   
         self.cell_r = math.sqrt((cell_h/2)**2 + (cell_w/2)**2)
-        self.no_cell = (self.w // self.cell_w) * (self.h // self.cell_h)
         self.min_noS = self.w * self.h // ((max(self.radius)**2)*9)
         self.max_noS = self.w * self.h // ((min(self.radius)**2))
         self.max_diagonal = max([self._distance([self.w, self.h], [self.radius[i] + self.ue[i], self.radius[i] + self.ue[i]]) for i in range(len(self.radius))])
+
+        self.engine = engine
+        self.model = SensorModel(radius, alpha1, alpha2, beta1, beta2, psm_resolution, psm_interpolation)
+        self.memory_budget = memory_budget
+        if isinstance(targets, np.memmap):
+            # Stays on disk, chunks are read and converted to float64 when used
+            self._targets = targets
+        else:
+            self._targets = np.asarray(targets, dtype=float).reshape(-1, 2)
+        # Coverage ratios are fractions of the targets, which need not be one per cell (target files)
+        self.no_targets = len(self._targets)
+        self._radius = self.model.radius
+        self._ue = self.model.ue
+        if spatial_index is None:
+            spatial_index = len(self._targets) > self.INDEX_MIN_TARGETS
+        self._target_index = GridIndex(self._targets, cell_w, cell_h) if spatial_index else None
+        self.cache = FitnessCache(cache_size, cache_step) if cache_size > 0 else None
+        self.type_samples = type_samples
+        self.type_refine = type_refine
+        # Replaced by the stream of the run when used by a HarmonySearch (see HarmonySearch.reseed)
+        self.rng = RandomStream()
     
 
 
@@ -57,6 +105,8 @@ class ObjectiveFunction():
 
 
     def get_coverage_ratio(self, node_list, type_assignment):
+        if self.engine == "numpy":
+            return self._coverage_ratio_np(node_list, type_assignment)[0]
         return self._coverage_ratio(node_list, type_assignment)[0]
     
     def _coverage_ratio(self, node_list, type_assignment):
@@ -84,24 +134,202 @@ class ObjectiveFunction():
                 target_corvered.append(target)
         
 
-        return len(target_corvered) / self.no_cell, target_corvered
+        return len(target_corvered) / self.no_targets, target_corvered
 
     def _md(self, node_list, type_assignment):
         min_dist_sensor = float('+inf')
         for ia, a in enumerate(node_list):
             for ib, b in enumerate(node_list):
-                if a != b:
+                if ia != ib:
                     min_dist_sensor = min(min_dist_sensor, self._distance(a, b) * ((self.radius[type_assignment[ia]]) * (self.radius[type_assignment[ib]])))
         if min_dist_sensor == float('+inf'):
             min_dist_sensor = 0.0
         return min_dist_sensor / (self.max_diagonal)
 
+    def _coverage_ratio_np(self, node_list, type_assignment):
+        """
+            Array-based version of _coverage_ratio, one sensor x target matrix per call
+        """
+        sensors = np.asarray(node_list, dtype=float).reshape(1, -1, 2)
+        types = np.asarray(type_assignment, dtype=int).reshape(1, -1)
+        covered = self._covered_batch(sensors, types, np.ones(types.shape, dtype=bool))[0]
+        return np.count_nonzero(covered) / self.no_targets, self._targets[covered]
+
+    def _md_np(self, node_list, type_assignment):
+        """
+            Array-based version of _md
+        """
+        sensors = np.asarray(node_list, dtype=float).reshape(1, -1, 2)
+        types = np.asarray(type_assignment, dtype=int).reshape(1, -1)
+        return float(self._md_batch(sensors, types, np.ones(types.shape, dtype=bool))[0])
+
+    def _covered_batch(self, sensors, types, valid):
+        """
+            Covered targets of a batch of harmonies
+            :param sensors: (B x n x 2) sensor positions
+            :param types: (B x n) type of each sensor
+            :param valid: (B x n) mask of the sensors in use
+            :return: (B x no targets) boolean mask
+        """
+        if self._target_index is not None:
+            return self._covered_indexed(sensors, types, valid)
+        covered = np.empty((len(sensors), len(self._targets)), dtype=bool)
+        for chunk in self._target_chunks(sensors.shape[0] * sensors.shape[1] * self.DENSE_BYTES):
+            dist = self._distance_matrix(sensors, self._target_block(chunk))
+            p = self._psm_matrix(dist, types)
+            covered[:, chunk] = self._covered_from_psm(p, dist <= self._radius[types][..., None], valid)
+        return covered
+
+    def _covered_indexed(self, sensors, types, valid):
+        """
+            _covered_batch through the target grid index, only the sensor-target pairs in range are visited
+        """
+        b_ind, n_ind = np.nonzero(valid)
+        kind = types[b_ind, n_ind]
+        r = self._radius[kind]
+        sensor, target, dist = self._target_index.query_pairs(sensors[b_ind, n_ind], self.model.reach[kind])
+        p = self.model.values(dist, kind[sensor])
+        detected = p != self.model.zero
+        harmony, target, p = b_ind[sensor][detected], target[detected], p[detected]
+        inside = dist[detected] <= r[sensor][detected]
+        return self._covered_from_pairs(harmony, target, p, inside, len(sensors))
+
+    def _covered_from_pairs(self, harmony, target, p, inside, no_harmonies):
+        """
+            Covered targets from the detecting sensor-target pairs of a batch, grouped by sensor in batch order
+            :param harmony: harmony of each pair
+            :param target: target of each pair
+            :param p: PSM value of each pair, see SensorModel
+            :param inside: whether the target of each pair is inside the sensor's radius
+            :return: (no_harmonies x no targets) boolean mask
+        """
+        chunks = self._target_chunks(no_harmonies * self.INDEXED_BYTES)
+        bounds = [0, len(target)]
+        if len(chunks) > 1:
+            # A stable sort keeps the order of the pairs of each target, so every chunk multiplies in the same order
+            order = np.argsort(target, kind="stable")
+            harmony, target, p, inside = harmony[order], target[order], p[order], inside[order]
+            bounds = np.searchsorted(target, [chunk.start for chunk in chunks] + [len(self._targets)])
+
+        covered = np.empty((no_harmonies, len(self._targets)), dtype=bool)
+        for k, chunk in enumerate(chunks):
+            pairs = slice(bounds[k], bounds[k + 1])
+            width = chunk.stop - chunk.start
+            cell = harmony[pairs] * width + target[pairs] - chunk.start
+            size = no_harmonies * width
+            count_ = np.bincount(cell, minlength=size)
+            count = np.bincount(cell[inside[pairs]], minlength=size)
+            Pov = 1 - self.model.combine_at(cell, p[pairs], size)
+
+            covered[:, chunk] = (((count == 1) & (count_ == 1) & (1 - Pov >= self.threshold)) \
+                                 | ((Pov >= self.threshold) & (count_ > 1))).reshape(no_harmonies, width)
+        return covered
+
+    def _target_chunks(self, target_bytes):
+        """
+            Slices of the targets such that a chunk takes at most memory_budget bytes, at target_bytes bytes per target
+        """
+        no_targets = len(self._targets)
+        if self.memory_budget is None:
+            return [slice(0, no_targets)]
+        size = max(1, int(self.memory_budget // max(target_bytes, 1)))
+        return [slice(start, min(start + size, no_targets)) for start in range(0, max(no_targets, 1), size)]
+
+    def _target_block(self, chunk):
+        """
+            Targets of a chunk as float64, read from disk when they are memory-mapped
+        """
+        return np.asarray(self._targets[chunk], dtype=float)
+
+    def _pairs_within(self, sensors, reach):
+        """
+            (sensor, target, distance) of every sensor-target pair closer than reach, a scalar or one per sensor
+        """
+        if self._target_index is not None:
+            return self._target_index.query_pairs(sensors, reach)
+        reach = np.asarray(reach, dtype=float)[..., None]
+        pairs = []
+        for chunk in self._target_chunks(len(sensors) * self.DENSE_BYTES):
+            dist = self._distance_matrix(sensors, self._target_block(chunk))
+            sensor, target = np.nonzero(dist <= reach)
+            pairs.append((sensor, target + chunk.start, dist[sensor, target]))
+        return tuple(np.concatenate(column) for column in zip(*pairs))
+
+    def _covered_from_psm(self, p, in_radius, valid):
+        """
+            Covered targets from sensor x target PSM rows
+            :param p: (B x n x no targets) PSM value of each sensor on each target, see SensorModel
+            :param in_radius: (B x n x no targets) mask of the targets inside each sensor's radius
+            :param valid: (B x n) mask of the sensors in use
+        """
+        detected = (p != self.model.zero) & valid[..., None]
+        count_ = detected.sum(axis=-2)
+        count = (detected & in_radius).sum(axis=-2)
+        Pov = 1 - self.model.combine(np.where(detected, p, self.model.one), axis=-2)
+
+        return ((count == 1) & (count_ == 1) & (1 - Pov >= self.threshold)) \
+                | ((Pov >= self.threshold) & (count_ > 1))
+
+    def _md_batch(self, sensors, types, valid):
+        """
+            _md of a batch of harmonies, arguments as in _covered_batch
+        """
+        if sensors.shape[-2] >= self.NEIGHBOR_MIN_SENSORS:
+            min_dist_sensor = self._min_weighted_distance(sensors, types, valid)
+        else:
+            r = self._radius[types]
+            dist = self._distance_matrix(sensors, sensors) * (r[..., :, None] * r[..., None, :])
+            same = np.eye(sensors.shape[-2], dtype=bool)
+            dist[same | ~valid[..., :, None] | ~valid[..., None, :]] = np.inf
+            min_dist_sensor = dist.min(axis=(-2, -1)) if dist.shape[-1] else np.full(dist.shape[:-2], np.inf)
+        min_dist_sensor[min_dist_sensor == np.inf] = 0.0
+        return min_dist_sensor / (self.max_diagonal)
+
+    def _min_weighted_distance(self, sensors, types, valid):
+        """
+            Radius-weighted minimum pairwise distance of each harmony by neighbor search.
+            Pairs are searched within a reach starting at the largest radius; a pair further than reach
+            weighs more than reach * min(radius)^2, so the search widens until the minimum found is below that.
+        """
+        b_ind, n_ind = np.nonzero(valid)
+        points = sensors[b_ind, n_ind]
+        r = self._radius[types[b_ind, n_ind]]
+        min_dist_sensor = np.full(len(sensors), np.inf)
+        if len(points) < 2:
+            return min_dist_sensor
+
+        # Lay the harmonies side by side, further apart than any reach searched: the first one (the largest
+        # radius) may exceed the diagonal cap of the later ones when the sensors are packed in a small box
+        extent = points.max(axis=0) - points.min(axis=0)
+        cap = math.sqrt(extent[0]**2 + extent[1]**2)
+        shifted = points.copy()
+        shifted[:, 0] += b_ind * (extent[0] + max(cap, self._radius.max()) + 1)
+
+        min_r2 = self._radius.min()**2
+        reach = np.full(len(sensors), self._radius.max())
+        pending = np.bincount(b_ind, minlength=len(sensors)) >= 2
+        while pending.any():
+            query = pending[b_ind]
+            i, j, _ = close_pairs(shifted[query], reach[b_ind[query]])
+            i, j = np.nonzero(query)[0][i], np.nonzero(query)[0][j]
+            diff = points[i] - points[j]
+            weighted = np.sqrt(diff[:, 0]**2 + diff[:, 1]**2) * (r[i] * r[j])
+            found = np.full(len(sensors), np.inf)
+            np.minimum.at(found, b_ind[i], weighted)
+
+            need = np.where(found < np.inf, found / min_r2, 2 * reach)
+            done = pending & ((need <= reach) | (reach >= cap))
+            min_dist_sensor[done] = found[done]
+            pending &= ~done
+            reach = np.where(pending, np.minimum(need, cap), reach)
+        return min_dist_sensor
+
     # Keep overlap sensor
     def _regularization1(self, node_list, type_assignment):
         no_interception = 0
         for ia, a in enumerate(node_list):
             for ib, b in enumerate(node_list):
-                if a!=b:
+                if ia != ib:
                     if(self._distance(a, b) < (self.radius[type_assignment[ia]] + self.radius[type_assignment[ib]])):
                             no_interception += 1
         no_interception = no_interception/2
@@ -109,6 +337,18 @@ class ObjectiveFunction():
         no_interception = no_interception/(n*(n-1)/2)
         
         return no_interception
+
+    def _regularization1_np(self, node_list, type_assignment):
+        """
+            _regularization1 by neighbor search, pairs are looked up within twice the largest radius
+        """
+        nodes = np.asarray(node_list, dtype=float).reshape(-1, 2)
+        r = self._radius[np.asarray(type_assignment, dtype=int)]
+        n = len(nodes)
+        if n < 2:
+            return 0.0
+        i, j, dist = close_pairs(nodes, 2 * self._radius.max())
+        return np.count_nonzero(dist < r[i] + r[j]) / (n*(n-1)/2)
     
 
     ## Keep one sensor in one cell
@@ -128,9 +368,20 @@ class ObjectiveFunction():
         
         return loss 
 
+    def _regularization2_np(self, node_list, type_assignment):
+        """
+            Array-based version of _regularization2, through the target grid index when there is one
+        """
+        nodes = np.asarray(node_list, dtype=float).reshape(-1, 2)
+        _, target, _ = self._pairs_within(nodes, self.cell_r)
+        node_in_cells = np.bincount(target, minlength=len(self._targets))
+        return np.square(node_in_cells/25 - 1.0/25).sum()
 
-    def get_fitness(self, harmony):
 
+    def get_fitness(self, harmony, type_trace=None):
+        """
+            :param type_trace: type of each used sensor, drawn at random when not given
+        """
         used = []
         
         for id, sensor in enumerate(harmony):
@@ -142,29 +393,233 @@ class ObjectiveFunction():
         if len(used) < self.min_noS:
                 return (float('-inf'), 0), []
 
-        type_traces = [[random.choice([0, 1]) for j in range(len(used))] for i in range(1)]
+        if type_trace is None and self._type_search_enabled():
+            type_traces = [self._type_search(used)]
+        elif type_trace is None:
+            # Drawn by _evaluate_cached, unless the positions are already cached with a trace
+            type_traces = [None]
+        else:
+            type_traces = [list(type_trace)]
         
         best_fitness = float('-inf')
         best_coverage_ratio = 0
         best_trace = None
 
         for type_trace in type_traces:
-        
-            coverage_ratio, _ = self._coverage_ratio(used, type_trace)
-            
-            fitness =  (coverage_ratio)  * self._senscost(used)* self._md(used, type_trace)
-            # fitness =  (coverage_ratio)  * self._senscost(used)* self._regularization2(used, type_trace)
+
+            fitness, coverage_ratio, type_trace = self._evaluate_cached(used, type_trace)
 
             if fitness > best_fitness:
                 best_fitness = fitness
                 best_coverage_ratio = coverage_ratio
-                best_trace = type_trace
+                best_trace = list(type_trace)
 
         return (best_fitness, best_coverage_ratio), best_trace
 
+    def get_fitness_batch(self, harmonies, types=None):
+        """
+            Score a block of candidate harmonies in one call
+            :param harmonies: (B x hmv x 2) array, nodes with a negative coordinate are unused
+            :param types: optional (B x hmv) type of each node, drawn at random when not given
+            :return: fitness (B,), coverage ratio (B,) and the type trace of each candidate
+        """
+        drawn = types is None and not self._type_search_enabled()
+        harmonies, valid, types = self._prepare_batch(harmonies, types)
+        if self.cache is not None:
+            return self._fitness_batch_cached(harmonies, types, valid, drawn)
+        covered = self._covered_batch(harmonies, types, valid)
+        return self._fitness_batch(harmonies, types, valid, covered)
+
+    def _fitness_batch_cached(self, harmonies, types, valid, drawn=False):
+        """
+            get_fitness_batch that only evaluates the candidates missing from the cache
+
+            :param drawn: the types were drawn at random, candidates are then looked up on their positions and a hit
+                          takes the cached type trace
+        """
+        fitness = np.empty(len(harmonies))
+        coverage_ratio = np.empty(len(harmonies))
+        keys = self.cache.keys(harmonies, None if drawn else types, valid)
+        missing = []
+        for b, key in enumerate(keys):
+            value = self.cache.get(key)
+            if value is None:
+                missing.append(b)
+            else:
+                fitness[b], coverage_ratio[b], trace = value
+                types[b][valid[b]] = trace
+        if len(missing) == len(harmonies):
+            covered = self._covered_batch(harmonies, types, valid)
+            fitness, coverage_ratio, _ = self._fitness_batch(harmonies, types, valid, covered)
+        elif missing:
+            covered = self._covered_batch(harmonies[missing], types[missing], valid[missing])
+            fitness[missing], coverage_ratio[missing], _ = self._fitness_batch(harmonies[missing], types[missing],
+                                                                               valid[missing], covered)
+        for b in missing:
+            self.cache.put(keys[b], (fitness[b], coverage_ratio[b], types[b][valid[b]].tolist()))
+
+        rejected = valid.sum(axis=1) < self.min_noS
+        type_traces = [[] if rejected[b] else types[b][valid[b]].tolist() for b in range(len(harmonies))]
+        return fitness, coverage_ratio, type_traces
+
+    def _prepare_batch(self, harmonies, types=None):
+        harmonies = np.asarray(harmonies, dtype=float)
+        valid = (harmonies[..., 0] >= 0) & (harmonies[..., 1] >= 0)
+        if types is None and self._type_search_enabled():
+            types = np.zeros(valid.shape, dtype=int)
+            for b in range(len(harmonies)):
+                if valid[b].sum() >= self.min_noS:
+                    types[b][valid[b]] = self._type_search(harmonies[b][valid[b]])
+        elif types is None:
+            types = self.rng.integers(self.model.ntypes, valid.shape)
+        return harmonies, valid, np.asarray(types, dtype=int)
+
+    def _fitness_batch(self, harmonies, types, valid, covered):
+        """
+            Fold the covered targets, sensor cost and min distance of a batch into fitness
+        """
+        no_used = valid.sum(axis=1)
+        coverage_ratio = np.count_nonzero(covered, axis=1) / self.no_targets
+        x = (no_used - self.min_noS) / (self.max_noS - self.min_noS)
+        fitness = coverage_ratio * (1 / (10*x + 1)) * self._md_batch(harmonies, types, valid)
+
+        rejected = no_used < self.min_noS
+        fitness[rejected] = float('-inf')
+        coverage_ratio[rejected] = 0
+        type_traces = [[] if rejected[b] else types[b][valid[b]].tolist() for b in range(len(harmonies))]
+        return fitness, coverage_ratio, type_traces
+
+    def _type_search_enabled(self):
+        return self.type_samples > 1 or self.type_refine > 0
+
+    def _type_search(self, used):
+        """
+            Type trace of the used sensors with the best fitness found: type_samples random traces, then greedy
+            single-sensor flips. Everything is scored from one set of sensor-target pairs; the coverage of a flip
+            only changes on the targets in reach of the flipped sensor, so a pass scores all flips at once.
+        """
+        sensors = np.asarray(used, dtype=float).reshape(-1, 2)
+        n, ntypes, no_targets = len(sensors), self.model.ntypes, len(self._targets)
+        traces = np.array(self.rng.integers(ntypes, (self.type_samples, n)))
+        if n < 2:
+            return traces[0].tolist()
+        radius = self._radius
+
+        sensor, target, dist = self._pairs_within(sensors, self.model.reach.max())
+        # PSM, detection and in-radius flags of every sensor-target pair under every type (ntypes x pairs)
+        p = self.model.values(dist[None], np.arange(ntypes)[:, None])
+        detected = p != self.model.zero
+        inside = detected & (dist[None] <= radius[:, None])
+        with np.errstate(divide="ignore"):
+            logp = np.where(detected, self.model.log_values(p), 0.0)
+        gap = self._distance_matrix(sensors, sensors)
+        np.fill_diagonal(gap, np.inf)
+
+        # Sampled traces, coverage counted per (trace, target) cell and md from the shared sensor distances
+        pair = np.arange(len(sensor))
+        kind = traces[:, sensor]
+        cell = (np.arange(len(traces))[:, None] * no_targets + target).ravel()
+        covered = self._covered_pairs(cell, detected[kind, pair].ravel(), inside[kind, pair].ravel(),
+                                      logp[kind, pair].ravel(), len(traces) * no_targets)
+        r = radius[traces]
+        md = (gap * r[:, :, None] * r[:, None, :]).min(axis=(1, 2))
+        trace = traces[np.argmax(covered.reshape(len(traces), no_targets).sum(axis=1) * md)].copy()
+
+        for _ in range(self.type_refine):
+            kind = trace[sensor]
+            count_ = np.bincount(target, weights=detected[kind, pair], minlength=no_targets)
+            count = np.bincount(target, weights=inside[kind, pair], minlength=no_targets)
+            logprod = np.bincount(target, weights=logp[kind, pair], minlength=no_targets)
+            covered = self._covered_from_counts(count, count_, logprod)
+
+            # Covered targets after flipping the sensor of each pair to each type, summed per sensor
+            flipped = self._covered_from_counts(count[target] - inside[kind, pair] + inside,
+                                                count_[target] - detected[kind, pair] + detected,
+                                                logprod[target] - logp[kind, pair] + logp)
+            gain = np.stack([np.bincount(sensor, weights=flipped[t] * 1.0 - covered[target], minlength=n)
+                             for t in range(ntypes)])
+
+            # md after a flip: min of the pairs without the sensor and of its own pairs at the new radius
+            r = radius[trace]
+            weighted = gap * r[:, None] * r[None, :]
+            a, b = np.unravel_index(np.argmin(weighted), weighted.shape)
+            without = np.full(n, weighted[a, b])
+            for i in (a, b):
+                rest = weighted.copy()
+                rest[i, :] = np.inf
+                rest[:, i] = np.inf
+                without[i] = rest.min()
+            own = (gap * r[None, :]).min(axis=1)
+            md = np.minimum(without[None, :], own[None, :] * radius[:, None])
+
+            score = (covered.sum() + gain) * md
+            t, i = np.unravel_index(np.argmax(score), score.shape)
+            if score[t, i] <= covered.sum() * weighted[a, b]:
+                break
+            trace[i] = t
+        return trace.tolist()
+
+    def _covered_from_counts(self, count, count_, logprod):
+        """
+            Coverage test of _covered_from_psm from per-target counts and log of the PSM product
+        """
+        Pov = 1 - np.exp(logprod)
+        return ((count == 1) & (count_ == 1) & (1 - Pov >= self.threshold)) \
+                | ((Pov >= self.threshold) & (count_ > 1))
+
+    def _covered_pairs(self, cell, detected, inside, logp, size):
+        """
+            Covered cells from flat sensor-cell pairs
+        """
+        return self._covered_from_counts(np.bincount(cell, weights=inside, minlength=size),
+                                         np.bincount(cell, weights=detected, minlength=size),
+                                         np.bincount(cell, weights=logp, minlength=size))
+
+    def _evaluate_cached(self, used, type_trace=None):
+        """
+            Fitness, coverage ratio and type trace of the used sensors, the trace is drawn at random when not given
+        """
+        key = None if self.cache is None else self.cache.key(used, type_trace)
+        value = None if key is None else self.cache.get(key)
+        if value is None:
+            if type_trace is None:
+                type_trace = self.rng.integers(self.model.ntypes, len(used)).tolist()
+            value = self._evaluate(used, type_trace) + (list(type_trace),)
+            if key is not None:
+                self.cache.put(key, value)
+        return value
+
+    def _evaluate(self, used, type_trace):
+        """
+            Fitness and coverage ratio of the used sensors under one type trace
+        """
+        if self.engine == "numpy":
+            coverage_ratio, _ = self._coverage_ratio_np(used, type_trace)
+            fitness = (coverage_ratio) * self._senscost(used) * self._md_np(used, type_trace)
+        else:
+            coverage_ratio, _ = self._coverage_ratio(used, type_trace)
+            fitness = (coverage_ratio) * self._senscost(used) * self._md(used, type_trace)
+            # fitness =  (coverage_ratio)  * self._senscost(used)* self._regularization2(used, type_trace)
+        return fitness, coverage_ratio
+
     def _distance(self, x1, x2):
         return math.sqrt((x1[0] - x2[0])**2 + (x1[1] - x2[1])**2)
 
+    def _distance_matrix(self, a, b):
+        """
+            Pairwise distances between the rows of a (... x n x 2) and b (... x m x 2)
+        """
+        dx = a[..., :, None, 0] - b[..., None, :, 0]
+        dy = a[..., :, None, 1] - b[..., None, :, 1]
+        return np.sqrt(dx**2 + dy**2)
+
+    def _psm_matrix(self, dist, types):
+        """
+            Array-based version of _psm, dist is a sensor x target distance matrix.
+            Returns PSM values as defined by the SensorModel (log-probabilities with lookup tables)
+        """
+        return self.model.values(dist, types[..., None])
+
     def _psm(self,x, y, type):
         distance = self._distance(x, y)
         
@@ -0,0 +1,110 @@
+import bisect
+import csv
+import numpy as np
+
+
+class ParetoArchive():
+    COLUMNS = ["coverage", "cost", "fitness", "sensors"]
+
+    def __init__(self, capacity, hmv):
+        """
+            Non-dominated harmonies over (coverage ratio, weighted sensor count): the coverage is maximized and the
+            cost (sum of the type weights of the used sensors) minimized. Entries are kept sorted by increasing cost,
+            their coverage then increases too, so an insertion is a binary search plus the removal of the contiguous
+            run of entries it dominates. Past capacity, the entry with the smallest crowding distance is dropped;
+            the two extremes of the front are always kept.
+
+            :param capacity: maximum number of entries
+            :param hmv: harmony vector size
+        """
+        assert capacity >= 2, "The archive must hold both extremes of the front"
+        self.capacity = capacity
+        self.hmv = hmv
+        self._cost = []
+        self._coverage = []
+        self._fitness = []
+        self._positions = []
+        self._types = []
+        self._stacked = None
+
+    def __len__(self):
+        return len(self._cost)
+
+    def add(self, coverage, cost, harmony, types, fitness=0.0):
+        """
+            Insert a harmony unless an entry dominates or equals it, dropping the entries it dominates
+            :param harmony: (hmv x 2) positions, unused nodes negative
+            :param types: (hmv,) type of each node, -1 for unused nodes
+            :return: whether the harmony was inserted
+        """
+        coverage, cost = float(coverage), float(cost)
+        last = bisect.bisect_right(self._cost, cost)
+        if last > 0 and self._coverage[last - 1] >= coverage:
+            return False
+        start = bisect.bisect_left(self._cost, cost)
+        stop = start
+        while stop < len(self._cost) and self._coverage[stop] <= coverage:
+            stop += 1
+        for values, value in [(self._cost, cost), (self._coverage, coverage), (self._fitness, float(fitness)),
+                              (self._positions, np.array(harmony, dtype=float).reshape(self.hmv, 2)),
+                              (self._types, np.array(types, dtype=int).reshape(self.hmv))]:
+            values[start:stop] = [value]
+        if len(self._cost) > self.capacity:
+            self._remove(self._most_crowded())
+        self._stacked = None
+        return True
+
+    def _most_crowded(self):
+        """
+            Index of the entry with the smallest crowding distance, never an extreme of the front
+        """
+        cost = np.asarray(self._cost)
+        coverage = np.asarray(self._coverage)
+        span = np.maximum([cost[-1] - cost[0], coverage[-1] - coverage[0]], np.finfo(float).tiny)
+        crowding = (cost[2:] - cost[:-2]) / span[0] + (coverage[2:] - coverage[:-2]) / span[1]
+        return 1 + int(np.argmin(crowding))
+
+    def _remove(self, index):
+        for values in [self._cost, self._coverage, self._fitness, self._positions, self._types]:
+            del values[index]
+
+    def positions(self):
+        """
+            (n x hmv x 2) positions of the entries, in increasing cost
+        """
+        if self._stacked is None:
+            self._stacked = np.array(self._positions).reshape(len(self), self.hmv, 2)
+        return self._stacked
+
+    def front(self):
+        """
+            Entries in increasing cost, as dicts with the objectives, fitness, harmony and type trace of the used nodes
+        """
+        return [{"coverage": self._coverage[i], "cost": self._cost[i], "fitness": self._fitness[i],
+                 "harmony": self._positions[i].tolist(), "type": self._types[i][self._types[i] >= 0].tolist()}
+                for i in range(len(self))]
+
+    def state(self):
+        """
+            The archive as a dict of arrays (see Checkpointer.save)
+        """
+        return {"front_values": np.array([self._coverage, self._cost, self._fitness]).T.reshape(-1, 3),
+                "front_positions": self.positions(), "front_types": np.array(self._types, dtype=int).reshape(-1, self.hmv)}
+
+    def restore(self, state):
+        values = np.asarray(state["front_values"], dtype=float).reshape(-1, 3)
+        self._coverage, self._cost, self._fitness = (column.tolist() for column in values.T)
+        self._positions = list(np.array(state["front_positions"], dtype=float).reshape(-1, self.hmv, 2))
+        self._types = list(np.array(state["front_types"], dtype=int).reshape(-1, self.hmv))
+        self._stacked = None
+
+    def save(self, path):
+        """
+            Write the front as csv rows of COLUMNS, and the harmonies of its entries next to it as .npz
+        """
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.COLUMNS)
+            for i in range(len(self)):
+                writer.writerow([self._coverage[i], self._cost[i], self._fitness[i], int((self._types[i] >= 0).sum())])
+        np.savez(path.rsplit(".", 1)[0] + ".npz", **self.state())
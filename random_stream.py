@@ -0,0 +1,93 @@
+import json
+import math
+import numpy as np
+
+
+class RandomStream():
+    def __init__(self, seed=None, block=4096):
+        """
+            Random source of one run, backed by a numpy Generator. Each kind of draw (uniforms, normals, integers
+            below a given bound) is generated block values at a time and handed out as read-only slices of that block,
+            so the per-node draws of the search loop cost a slice instead of a call to the random module.
+
+            :param seed: seed of the stream, None for fresh entropy
+            :param block: number of values generated at once for each kind of draw
+        """
+        self.seed = seed
+        self.block = block
+        self._generator = np.random.default_rng(seed)
+        self._buffers = {}
+        self._positions = {}
+
+    def _draw(self, kind, n):
+        if kind == "uniform":
+            return self._generator.random(n)
+        if kind == "normal":
+            return self._generator.standard_normal(n)
+        return self._generator.integers(int(kind[len("integers"):]), size=n)
+
+    def _take(self, kind, size):
+        """
+            The next values of kind, a scalar when size is None and an array of shape size otherwise
+        """
+        n = 1 if size is None else size if isinstance(size, int) else math.prod(size)
+        buffer = self._buffers.get(kind)
+        position = self._positions.get(kind, 0)
+        if buffer is None or position + n > len(buffer):
+            rest = buffer[position:] if buffer is not None else self._draw(kind, 0)
+            buffer = np.concatenate([rest, self._draw(kind, max(self.block, n - len(rest)))])
+            buffer.flags.writeable = False
+            self._buffers[kind] = buffer
+            position = 0
+        self._positions[kind] = position + n
+        if size is None:
+            return buffer[position].item()
+        return buffer[position:position + n].reshape(size)
+
+    def random(self, size=None):
+        """
+            Uniform floats in [0, 1)
+        """
+        return self._take("uniform", size)
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        """
+            Uniform floats in [low, high)
+        """
+        return low + (high - low) * self._take("uniform", size)
+
+    def integers(self, high, size=None):
+        """
+            Uniform integers in [0, high)
+        """
+        return self._take("integers{}".format(int(high)), size)
+
+    def normal(self, loc=0.0, scale=1.0, size=None):
+        return loc + scale * self._take("normal", size)
+
+    def state(self):
+        """
+            The stream as a dict of arrays (see Checkpointer.save), the values left in its blocks included
+        """
+        state = {"rng_seed": -1 if self.seed is None else self.seed, "rng_block": self.block,
+                 "rng_bit_generator": json.dumps(self._generator.bit_generator.state)}
+        for kind, buffer in self._buffers.items():
+            state["rng_" + kind] = buffer[self._positions[kind]:]
+        return state
+
+    def restore(self, state):
+        """
+            Continue the stream saved by state() exactly where it stopped
+        """
+        seed = int(state["rng_seed"])
+        self.seed = None if seed < 0 else seed
+        self.block = int(state["rng_block"])
+        self._generator.bit_generator.state = json.loads(str(state["rng_bit_generator"]))
+        self._buffers = {}
+        self._positions = {}
+        for key in state:
+            if key.startswith("rng_") and key not in ["rng_seed", "rng_block", "rng_bit_generator"]:
+                buffer = np.array(state[key])
+                buffer.flags.writeable = False
+                self._buffers[key[len("rng_"):]] = buffer
+                self._positions[key[len("rng_"):]] = 0
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+class ParameterSchedule():
+    """
+        hmcr, par and bandwidth used by HarmonySearch at each step of a run, and the pitch adjustment itself.
+        Subclass it (and add it to SCHEDULES to make it available by name) for a custom schedule.
+    """
+    steps = 1
+    step = 0
+
+    def start(self, harmony_search, steps, step=0):
+        """
+            Called when a run of steps steps starts (or resumes) at step
+        """
+        self.steps = steps
+        self.step = step
+
+    def update(self, harmony_search):
+        """
+            Called once per step before its candidates are generated
+        """
+        self.step += 1
+
+    def parameters(self, harmony_search, n):
+        """
+            hmcr (n,), par (n,) and x/y bandwidth (n x 2) of the n candidates of the current step
+        """
+        return (np.full(n, float(harmony_search.hmcr)), np.full(n, float(harmony_search.par)),
+                np.broadcast_to(np.asarray(harmony_search.BW, dtype=float), (n, 2)))
+
+    def adjust(self, harmony_search, positions, offsets, nodes):
+        """
+            Pitch adjustment of positions (... x 2) by offsets (bandwidth times a rate in [-1, 1] per axis),
+            nodes is the index of each position in its harmony
+        """
+        return positions + offsets
+
+    def feedback(self, harmony_search, chosen, accepted):
+        """
+            Called after each step with the index of the candidate sent to the harmony memory and whether it was kept
+        """
+        pass
+
+
+class ImprovedSchedule(ParameterSchedule):
+    def __init__(self, par_min=0.01, par_max=0.99, bw_min=0.01, bw_max=None, decay="exponential"):
+        """
+            Improved Harmony Search: par grows linearly from par_min to par_max over the run while the bandwidth
+            decays from bw_max to bw_min
+
+            :param bw_min, bw_max: bandwidth at the end and start of the run, scalar or (x, y);
+                                   bw_max defaults to the BW of the HarmonySearch
+            :param decay: "exponential" or "linear" bandwidth decay
+        """
+        assert decay in ["exponential", "linear"], "Unknown bandwidth decay"
+        self.par_min = par_min
+        self.par_max = par_max
+        self.bw_min = bw_min
+        self.bw_max = bw_max
+        self.decay = decay
+
+    def parameters(self, harmony_search, n):
+        progress = min(self.step / max(self.steps, 1), 1.0)
+        bw_max = np.asarray(harmony_search.BW if self.bw_max is None else self.bw_max, dtype=float)
+        bw_min = np.asarray(self.bw_min, dtype=float)
+        if self.decay == "exponential":
+            bw = bw_max * np.exp(np.log(bw_min / bw_max) * progress)
+        else:
+            bw = bw_max - (bw_max - bw_min) * progress
+        par = self.par_min + (self.par_max - self.par_min) * progress
+        return (np.full(n, float(harmony_search.hmcr)), np.full(n, par), np.broadcast_to(bw, (n, 2)))
+
+
+class GlobalBestSchedule(ParameterSchedule):
+    """
+        Global-best Harmony Search: an adjusted node moves next to the same node of the best harmony in memory
+        instead of next to its own position. Nodes the best harmony does not use are adjusted as usual.
+    """
+    def adjust(self, harmony_search, positions, offsets, nodes):
+        memory = harmony_search._harmony_memory
+        best = memory.positions[memory.best()][nodes]
+        return np.where((best >= 0).all(axis=-1, keepdims=True), best, positions) + offsets
+
+
+class SelfAdaptiveSchedule(ParameterSchedule):
+    def __init__(self, hmcr=0.98, par=0.9, hmcr_std=0.01, par_std=0.05, learning_period=100, bw_min=None, bw_max=None):
+        """
+            Self-adaptive Harmony Search: the hmcr and par of every candidate are drawn from normal distributions
+            whose means move, every learning_period steps, to the mean of the values of the candidates kept in memory.
+            The bandwidth decays linearly from bw_max to bw_min over the first half of the run.
+
+            :param hmcr, par: initial means
+            :param bw_min, bw_max: scalar or (x, y), default to a tenth of and the BW of the HarmonySearch
+        """
+        self.hmcr = hmcr
+        self.par = par
+        self.hmcr_mean = hmcr
+        self.par_mean = par
+        self.hmcr_std = hmcr_std
+        self.par_std = par_std
+        self.learning_period = learning_period
+        self.bw_min = bw_min
+        self.bw_max = bw_max
+        self._drawn = None
+        self._kept = []
+
+    def start(self, harmony_search, steps, step=0):
+        super().start(harmony_search, steps, step)
+        self.hmcr_mean = self.hmcr
+        self.par_mean = self.par
+        self._drawn = None
+        self._kept = []
+
+    def update(self, harmony_search):
+        super().update(harmony_search)
+        if self.step % self.learning_period == 0 and self._kept:
+            self.hmcr_mean, self.par_mean = np.mean(self._kept, axis=0)
+            self._kept = []
+
+    def parameters(self, harmony_search, n):
+        hmcr = np.clip(harmony_search.rng.normal(self.hmcr_mean, self.hmcr_std, n), 0, 1)
+        par = np.clip(harmony_search.rng.normal(self.par_mean, self.par_std, n), 0, 1)
+        self._drawn = (hmcr, par)
+
+        bw_max = np.asarray(harmony_search.BW if self.bw_max is None else self.bw_max, dtype=float)
+        bw_min = bw_max / 10 if self.bw_min is None else np.asarray(self.bw_min, dtype=float)
+        progress = min(2 * self.step / max(self.steps, 1), 1.0)
+        return hmcr, par, np.broadcast_to(bw_max - (bw_max - bw_min) * progress, (n, 2))
+
+    def feedback(self, harmony_search, chosen, accepted):
+        if accepted and self._drawn is not None:
+            self._kept.append((self._drawn[0][chosen], self._drawn[1][chosen]))
+
+
+SCHEDULES = {
+    "constant": ParameterSchedule,
+    "improved": ImprovedSchedule,
+    "global_best": GlobalBestSchedule,
+    "self_adaptive": SelfAdaptiveSchedule,
+}
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+class SensorModel():
+    def __init__(self, radius, alpha1=1, alpha2=0, beta1=1, beta2=0.5, resolution=0, interpolation="linear"):
+        """
+            Probabilistic sensing model of N sensor types, type k senses within radius[k] with an uncertainty
+            band of radius[k] / 2 on both sides.
+
+            The PSM of a sensor on a target is given as a "value": the probability itself when computed exactly,
+            or its log when looked up in the per-type tables, so that the product of the PSMs of the sensors
+            detecting a target (Pov) becomes a sum. zero and one are the values of probability 0 and 1.
+
+            :param radius: radius of each node type
+            :param alpha1, alpha2, beta1, beta2: parameter for calculating Pov
+            :param resolution: number of samples of each per-type table over the uncertainty band, indexed by
+                               squared distance; 0 computes the PSM exactly
+            :param interpolation: "linear" or "nearest" table lookup
+        """
+        assert interpolation in ["linear", "nearest"], "Unknown PSM table interpolation"
+        assert resolution == 0 or resolution >= 2, "A PSM table needs at least two samples"
+        self.radius = np.asarray(radius, dtype=float)
+        self.ue = self.radius / 2
+        self.ntypes = len(self.radius)
+        self.reach = self.radius + self.ue
+        # Relative cost of each type by its rank in increasing radius, the largest type counts as one sensor
+        # whatever order the radii are given in; types of equal radius cost the same
+        self.weights = np.searchsorted(np.sort(self.radius), self.radius, side="right") / self.ntypes
+        self.alpha1 = alpha1
+        self.alpha2 = alpha2
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.resolution = resolution
+        self.interpolation = interpolation
+
+        self.log = bool(resolution)
+        self.zero = -np.inf if self.log else 0.0
+        self.one = 0.0 if self.log else 1.0
+        if self.log:
+            low2 = (self.radius - self.ue)**2
+            step2 = (self.reach**2 - low2) / (resolution - 1)
+            samples = np.sqrt(low2[:, None] + step2[:, None] * np.arange(resolution))
+            p = self.exact(samples, self.radius[:, None], self.ue[:, None])
+            with np.errstate(divide="ignore"):
+                # The last sample sits on the edge of the band where the PSM is 0, clamped so it can be interpolated
+                table = np.maximum(np.log(p), np.log(np.finfo(float).tiny))
+            # Flat tables, the row of type k starts at k * resolution; the first sample (PSM 1) also serves closer targets
+            self._table = table.ravel()
+            self._slope = np.diff(table, axis=1, append=table[:, -1:]).ravel()
+            self._scale = 1 / step2
+            self._offset = -low2 / step2
+
+    def exact(self, dist, r, ue):
+        """
+            PSM for distances dist to sensors of radius r and uncertainty ue
+        """
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            lambda1 = np.power(ue - r + dist, self.beta1)
+            lambda2 = np.power(ue + r - dist, self.beta2)
+            p = np.exp(-(self.alpha1*lambda1/lambda2 + self.alpha2))
+        p = np.where(dist > r + ue, 0.0, p)
+        return np.where(dist < r - ue, 1.0, p)
+
+    def values(self, dist, types):
+        """
+            PSM values for distances dist to sensors of types types (broadcast against dist)
+        """
+        if not self.log:
+            return self.exact(dist, self.radius[types], self.ue[types])
+        position = np.clip(dist * dist * self._scale[types] + self._offset[types], 0, self.resolution - 1)
+        if self.interpolation == "nearest":
+            value = np.take(self._table, np.rint(position).astype(int) + types * self.resolution)
+        else:
+            index = position.astype(int)
+            flat = index + types * self.resolution
+            value = np.take(self._table, flat) + np.take(self._slope, flat) * (position - index)
+        return np.where(dist >= self.reach[types], -np.inf, value)
+
+    def combine(self, values, axis):
+        """
+            Product of the PSMs along axis
+        """
+        if self.log:
+            return np.exp(values.sum(axis=axis))
+        return values.prod(axis=axis)
+
+    def combine_at(self, cell, values, size):
+        """
+            Product of the PSMs falling in each of size cells
+        """
+        if self.log:
+            return np.exp(np.bincount(cell, weights=values, minlength=size))
+        prod = np.ones(size)
+        np.multiply.at(prod, cell, values)
+        return prod
+
+    def log_values(self, values):
+        """
+            Log of the PSMs, values must not be zero
+        """
+        return values if self.log else np.log(values)
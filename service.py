@@ -0,0 +1,442 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from harmony_search import HarmonySearch
+from objective_function import ObjectiveFunction
+from stopping import StoppingCriterion, TargetCoverage
+from targets import grid_targets
+
+# HarmonySearch arguments a job may set
+SEARCH_PARAMETERS = ["hms", "hmcr", "par", "BW", "n_search", "delta_eval", "pareto_archive"]
+
+
+def geometry_of(problem):
+    """
+        What identifies the problem of a job: field, cells, node radii, hmv and a digest of its targets
+    """
+    targets = problem.get("targets")
+    digest = "grid" if targets is None else hashlib.sha1(np.asarray(targets, dtype=float).tobytes()).hexdigest()
+    return {"W": problem["W"], "H": problem["H"], "cellw": problem.get("cellw", 10), "cellh": problem.get("cellh", 10),
+            "hmv": problem.get("hmv", 25), "radius": [float(r) for r in problem["radius"]], "targets": digest}
+
+
+def geometry_key(geometry):
+    return json.dumps(geometry, sort_keys=True)
+
+
+class SolutionCache():
+    def __init__(self, capacity=256, size=30, path=None):
+        """
+            Final harmony memories of finished jobs keyed by problem geometry, the warm start of new jobs
+
+            :param capacity: number of geometries kept, least recently used first out
+            :param size: number of harmonies kept per geometry, the best ones
+            :param path: json file the cache is loaded from and saved to after every update, None to keep it in memory
+        """
+        self.capacity = capacity
+        self.size = size
+        self.path = path
+        self._entries = OrderedDict()
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for entry in json.load(f):
+                    self._entries[geometry_key(entry["geometry"])] = entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, geometry, harmonies, fitness):
+        """
+            Merge (harmony, type_trace) pairs and their fitness into the entry of geometry
+        """
+        key = geometry_key(geometry)
+        entry = self._entries.pop(key, {"geometry": geometry, "harmonies": [], "fitness": []})
+        pairs = sorted(zip(entry["fitness"] + list(fitness), entry["harmonies"] + [list(pair) for pair in harmonies]),
+                       key=lambda pair: -pair[0])[:self.size]
+        entry["fitness"] = [float(value) for value, _ in pairs]
+        entry["harmonies"] = [pair for _, pair in pairs]
+        self._entries[key] = entry
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        if self.path is not None:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(list(self._entries.values()), f)
+            os.replace(tmp, self.path)
+
+    @staticmethod
+    def distance(a, b):
+        """
+            How far apart two geometries are, None when their harmonies cannot be reused (other field or hmv)
+        """
+        if (a["W"], a["H"], a["hmv"]) != (b["W"], b["H"], b["hmv"]):
+            return None
+        if len(a["radius"]) == len(b["radius"]):
+            radius = np.abs(np.subtract(a["radius"], b["radius"])).sum() / np.sum(a["radius"])
+        else:
+            radius = 1 + abs(np.mean(a["radius"]) - np.mean(b["radius"])) / np.mean(a["radius"])
+        return float(radius + (a["targets"] != b["targets"]) + ((a["cellw"], a["cellh"]) != (b["cellw"], b["cellh"])))
+
+    def nearest(self, geometry, n):
+        """
+            Up to n (harmony, type_trace) pairs from the closest geometries, closest first; the type traces are dropped
+            (None) when the number of node types differs
+            :return: the pairs and the keys of the geometries they come from
+        """
+        ranked = []
+        for key, entry in self._entries.items():
+            distance = self.distance(geometry, entry["geometry"])
+            if distance is not None:
+                ranked.append((distance, key))
+        pairs, sources = [], []
+        for _, key in sorted(ranked):
+            entry = self._entries[key]
+            same_types = len(entry["geometry"]["radius"]) == len(geometry["radius"])
+            taken = [(harmony, trace if same_types else None) for harmony, trace in entry["harmonies"][:n - len(pairs)]]
+            if taken:
+                self._entries.move_to_end(key)
+                pairs.extend(taken)
+                sources.append(key)
+            if len(pairs) >= n:
+                break
+        return pairs, sources
+
+
+class _Progress(StoppingCriterion):
+    """
+        Never stops a run by itself: reports its progress to the service every every steps, and stops it with
+        reason "cancelled" once the service has flagged the job
+    """
+    reason = "cancelled"
+
+    def __init__(self, job, queue, cancelled, every):
+        self.job = job
+        self.queue = queue
+        self.cancelled = cancelled
+        self.every = every
+
+    def check(self, harmony_search, step, best_ind):
+        if (step + 1) % self.every:
+            return False
+        memory = harmony_search._harmony_memory
+        self.queue.put({"job": self.job, "event": "progress", "step": step + 1, "evaluations": harmony_search.evaluations,
+                        "fitness": float(memory.fitness[best_ind]), "coverage": float(memory.coverage[best_ind])})
+        return self.job in self.cancelled
+
+
+# ObjectiveFunctions already built by a worker process, by geometry
+_problems = OrderedDict()
+
+
+def _objective_function(problem, geometry, hms):
+    key = geometry_key(geometry)
+    if key not in _problems:
+        w, h = problem["W"], problem["H"]
+        targets = problem.get("targets")
+        if targets is None:
+            targets = grid_targets(w, h, geometry["cellw"], geometry["cellh"])
+        _problems[key] = ObjectiveFunction(geometry["hmv"], hms, targets, types=len(problem["radius"]), radius=problem["radius"],
+                                           w=w, h=h, cell_w=geometry["cellw"], cell_h=geometry["cellh"])
+        while len(_problems) > 8:
+            _problems.popitem(last=False)
+    _problems.move_to_end(key)
+    return _problems[key]
+
+
+def _job_worker(job, spec, geometry, initial_harmonies, savedir, queue, cancelled, every):
+    """
+        One job in a worker process of the service
+    """
+    queue.put({"job": job, "event": "started"})
+    start = time.time()
+    problem = spec["problem"]
+    search = {name: value for name, value in spec.get("search", {}).items() if name in SEARCH_PARAMETERS}
+    obj_func = _objective_function(problem, geometry, search.get("hms", 30))
+    w, h, radius = problem["W"], problem["H"], problem["radius"]
+    stopping = [_Progress(job, queue, cancelled, every)]
+    if spec.get("target_coverage") is not None:
+        stopping.insert(0, TargetCoverage(spec["target_coverage"]))
+    hsa = HarmonySearch(obj_func, [w, h], [geometry["cellw"], geometry["cellh"]], hmv=geometry["hmv"],
+                        lower=[[r/2, r/2] for r in radius], upper=[[w-r/2, h-r/2] for r in radius],
+                        min_no=w * h // ((max(radius)**2)*9), savedir=savedir, stopping=stopping,
+                        plot=spec.get("plot", "off"), **search)
+    try:
+        result = hsa._run(spec.get("type_init", "default"), steps=spec.get("steps", 1000), seed=spec.get("seed"),
+                          progress=False, initial_harmonies=initial_harmonies or None)
+    finally:
+        hsa.close()
+
+    memory = hsa._harmony_memory
+    top = [slot for slot in memory.top(hsa.hms) if np.isfinite(memory.fitness[slot])]
+    result.update({"evaluations": hsa.evaluations, "seconds": time.time() - start,
+                   "memory": [memory[slot][:2] for slot in top], "memory_fitness": memory.fitness[top].tolist()})
+    return result
+
+
+class JobService():
+    def __init__(self, root, workers=2, max_queue=100, cache=None, warm_start=10, progress_every=100):
+        """
+            Long-lived optimization service: jobs are queued, run on a bounded pool of worker processes and warm-started
+            from the final memories of earlier jobs on the nearest geometries
+
+            :param root: directory the jobs save under, root/job<id>
+            :param workers: number of jobs run at once
+            :param max_queue: number of unfinished jobs past which submissions are refused
+            :param cache: SolutionCache, a new in-memory one when not given
+            :param warm_start: number of cached harmonies a job starts from at most, 0 to start cold
+            :param progress_every: number of steps between two progress events of a job
+        """
+        self.root = root
+        self.workers = workers
+        self.max_queue = max_queue
+        self.cache = cache if cache is not None else SolutionCache()
+        self.warm_start = warm_start
+        self.progress_every = progress_every
+        self.jobs = {}
+        # Ids go on after the jobs of an earlier service on the same root, each job saves in a new directory
+        existing = [int(name[3:]) for name in os.listdir(root) if name.startswith("job") and name[3:].isdigit()]\
+            if os.path.isdir(root) else []
+        self._ids = itertools.count(max(existing, default=-1) + 1)
+        self._started = time.time()
+        self._loop = None
+
+    async def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.workers)
+        # Spawned, a forked worker would hold on to the client connections open at that time
+        context = multiprocessing.get_context("spawn")
+        self._manager = context.Manager()
+        self._queue = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        self._reader = threading.Thread(target=self._read_events, daemon=True)
+        self._reader.start()
+
+    async def close(self):
+        self._queue.put(None)
+        self._reader.join()
+        self._executor.shutdown(cancel_futures=True)
+        self._manager.shutdown()
+
+    def _read_events(self):
+        """
+            Forward the events the workers put on the manager queue to the event loop
+        """
+        while True:
+            event = self._queue.get()
+            if event is None:
+                return
+            self._loop.call_soon_threadsafe(self._on_event, event)
+
+    def _on_event(self, event):
+        job = self.jobs[event["job"]]
+        if event["event"] == "started":
+            # The event may be handled after the job has ended, its status then stays final
+            if job["status"] != "queued":
+                return
+            job["status"] = "running"
+            job["started"] = time.time()
+        else:
+            job["progress"] = event
+        self._publish(job, event)
+
+    def _publish(self, job, event):
+        for subscriber in job["subscribers"]:
+            subscriber.put_nowait(event)
+
+    def submit(self, spec):
+        """
+            Queue a job, spec holds its "problem" (W, H, radius, and optionally cellw, cellh, hmv, targets), its
+            "search" arguments (see SEARCH_PARAMETERS), and optionally steps, seed, type_init, target_coverage and plot
+            :return: the job id
+        """
+        unfinished = sum(job["status"] in ["queued", "running"] for job in self.jobs.values())
+        if unfinished >= self.max_queue:
+            raise RuntimeError("Too many unfinished jobs")
+        geometry = geometry_of(spec["problem"])
+        job_id = next(self._ids)
+        job = {"id": job_id, "status": "queued", "spec": spec, "geometry": geometry, "submitted": time.time(),
+               "started": None, "finished": None, "progress": None, "result": None, "error": None, "subscribers": []}
+        self.jobs[job_id] = job
+        job["task"] = asyncio.ensure_future(self._run_job(job))
+        return job_id
+
+    async def _run_job(self, job):
+        async with self._slots:
+            if job["status"] == "cancelled":
+                return
+            # Looked up when the job starts, so it benefits from the jobs finished while it was queued
+            initial_harmonies, sources = self.cache.nearest(job["geometry"], self.warm_start) if self.warm_start else ([], [])
+            job["warm_start"] = {"harmonies": len(initial_harmonies), "geometries": sources}
+            savedir = os.path.join(self.root, "job{}".format(job["id"]))
+            try:
+                result = await self._loop.run_in_executor(self._executor, _job_worker, job["id"], job["spec"], job["geometry"],
+                                                          initial_harmonies, savedir, self._queue, self._cancelled,
+                                                          self.progress_every)
+            except Exception as error:
+                job["status"], job["error"] = "failed", repr(error)
+            else:
+                self.cache.put(job["geometry"], result.pop("memory"), result.pop("memory_fitness"))
+                job["status"] = "cancelled" if result["stop_reason"] == "cancelled" else "done"
+                job["result"] = result
+            job["finished"] = time.time()
+        self._publish(job, {"job": job["id"], "event": job["status"]})
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        if job["status"] == "queued":
+            job["status"] = "cancelled"
+            job["finished"] = time.time()
+            self._publish(job, {"job": job_id, "event": "cancelled"})
+        elif job["status"] == "running":
+            self._cancelled[job_id] = True
+
+    def status(self, job_id):
+        job = self.jobs[job_id]
+        return {name: job[name] for name in ["id", "status", "submitted", "started", "finished", "progress", "result",
+                                             "error", "warm_start"] if name in job}
+
+    def stats(self):
+        """
+            Throughput and time to the target coverage of the jobs that set one
+        """
+        done = [job for job in self.jobs.values() if job["status"] == "done"]
+        reached = [job["result"]["seconds"] for job in done if job["result"]["stop_reason"] == "coverage"]
+        hours = (time.time() - self._started) / 3600
+        return {"jobs": len(self.jobs), "done": len(done), "jobs_per_hour": len(done) / hours if hours else 0.0,
+                "cache": len(self.cache), "time_to_target_mean": float(np.mean(reached)) if reached else None,
+                "reached_target": len(reached),
+                "status": {status: sum(job["status"] == status for job in self.jobs.values())
+                           for status in ["queued", "running", "done", "failed", "cancelled"]}}
+
+    async def handle(self, reader, writer):
+        """
+            One request per connection, a json line {"op": ...} answered with json lines:
+            submit (spec) -> {"job"}, status (job), result (job, waits for the end), cancel (job), stats, list,
+            and stream (job), which sends every event of the job until it ends
+        """
+        try:
+            request = json.loads(await reader.readline())
+            op = request.get("op")
+            if op == "submit":
+                await self._send(writer, {"job": self.submit(request["spec"])})
+            elif op == "status":
+                await self._send(writer, self.status(request["job"]))
+            elif op == "result":
+                job = self.jobs[request["job"]]
+                await asyncio.shield(job["task"])
+                await self._send(writer, self.status(request["job"]))
+            elif op == "cancel":
+                self.cancel(request["job"])
+                await self._send(writer, self.status(request["job"]))
+            elif op == "stats":
+                await self._send(writer, self.stats())
+            elif op == "list":
+                await self._send(writer, [{"id": job["id"], "status": job["status"]} for job in self.jobs.values()])
+            elif op == "stream":
+                await self._stream(writer, self.jobs[request["job"]])
+            else:
+                await self._send(writer, {"error": "Unknown op {}".format(op)})
+        except Exception as error:
+            await self._send(writer, {"error": repr(error)})
+        finally:
+            writer.close()
+
+    async def _stream(self, writer, job):
+        events = asyncio.Queue()
+        job["subscribers"].append(events)
+        try:
+            await self._send(writer, {"job": job["id"], "event": job["status"], "progress": job["progress"]})
+            while job["status"] in ["queued", "running"]:
+                event = await events.get()
+                await self._send(writer, event)
+        finally:
+            job["subscribers"].remove(events)
+
+    async def _send(self, writer, message):
+        writer.write((json.dumps(message) + "\n").encode())
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        await self.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        logging.getLogger("service").info("Serving on %s:%s", host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.close()
+
+
+async def request(message, host="127.0.0.1", port=8765):
+    """
+        Send one request to a running service and yield its answers
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        yield json.loads(line)
+    writer.close()
+
+
+async def _client(args):
+    if args.command == "submit":
+        if os.path.exists(args.spec):
+            with open(args.spec) as f:
+                spec = json.load(f)
+        else:
+            spec = json.loads(args.spec)
+        message = {"op": "submit", "spec": spec}
+    elif args.command in ["stats", "list"]:
+        message = {"op": args.command}
+    else:
+        message = {"op": args.command, "job": args.job}
+    async for answer in request(message, args.host, args.port):
+        print(json.dumps(answer))
+        if args.command == "submit" and args.stream:
+            async for event in request({"op": "stream", "job": answer["job"]}, args.host, args.port):
+                print(json.dumps(event))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local optimization job service")
+    parser.add_argument("--host", default="127.0.0.1", type=str)
+    parser.add_argument("--port", default=8765, type=int)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve")
+    serve.add_argument("--root", default="service", type=str)
+    serve.add_argument("--workers", default=2, type=int)
+    serve.add_argument("--maxqueue", default=100, type=int)
+    serve.add_argument("--cache", default=None, type=str, help="json file the warm-start cache is kept in")
+    serve.add_argument("--warmstart", default=10, type=int)
+    serve.add_argument("--every", default=100, type=int)
+    submit = commands.add_parser("submit")
+    submit.add_argument("spec", type=str, help="json file, or json text, of the job (see JobService.submit)")
+    submit.add_argument("--stream", action="store_true")
+    for command in ["status", "result", "cancel", "stream"]:
+        commands.add_parser(command).add_argument("job", type=int)
+    for command in ["stats", "list"]:
+        commands.add_parser(command)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        logging.basicConfig(level=logging.INFO)
+        service = JobService(args.root, args.workers, args.maxqueue, SolutionCache(path=args.cache), args.warmstart, args.every)
+        asyncio.run(service.serve(args.host, args.port))
+    else:
+        asyncio.run(_client(args))
@@ -0,0 +1,80 @@
+import numpy as np
+
+
+class GridIndex():
+    def __init__(self, points, cell_w, cell_h):
+        """
+            Uniform bucket grid over a fixed set of points
+
+            :param points: (n x 2) positions to index
+            :param cell_w, cell_h: width and height of a bucket
+        """
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+        if len(self.points):
+            self.origin = self.points.min(axis=0)
+            self.shape = (self._key(self.points).max(axis=0) + 1).astype(int)
+        else:
+            self.origin = np.zeros(2)
+            self.shape = np.ones(2, dtype=int)
+
+        cells = self._cell_id(self._key(self.points))
+        self._order = np.argsort(cells, kind="stable")
+        self._starts = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self.shape[0]*self.shape[1]))])
+
+    def _key(self, positions):
+        return np.floor((positions - self.origin) / [self.cell_w, self.cell_h]).astype(int)
+
+    def _cell_id(self, key):
+        return key[..., 0] * self.shape[1] + key[..., 1]
+
+    def query_pairs(self, centers, reach):
+        """
+            All (center, point) pairs closer than reach
+            :param centers: (m x 2) query positions
+            :param reach: scalar or (m,) query radius of each center
+            :return: center index, point index and distance of each pair, grouped by center in increasing order
+        """
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        reach = np.broadcast_to(np.asarray(reach, dtype=float), (len(centers),))
+        if not len(centers) or not len(self.points):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+
+        low = np.clip(self._key(centers - reach[:, None]), 0, self.shape - 1)
+        high = np.clip(self._key(centers + reach[:, None]), -1, self.shape - 1)
+        span = (high - low + 1).clip(0)
+        kx, ky = span.max(axis=0)
+        dx, dy = np.meshgrid(np.arange(kx), np.arange(ky), indexing="ij")
+        dx, dy = dx.ravel(), dy.ravel()
+
+        inside = (dx[None, :] < span[:, None, 0]) & (dy[None, :] < span[:, None, 1])
+        owner, box = np.nonzero(inside)
+        cells = (low[owner, 0] + dx[box]) * self.shape[1] + low[owner, 1] + dy[box]
+
+        count = self._starts[cells + 1] - self._starts[cells]
+        total = count.sum()
+        owner = np.repeat(owner, count)
+        offset = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+        point = self._order[np.repeat(self._starts[cells], count) + offset]
+
+        diff = centers[owner] - self.points[point]
+        dist = np.sqrt(diff[:, 0]**2 + diff[:, 1]**2)
+        close = dist <= reach[owner]
+        return owner[close], point[close], dist[close]
+
+
+def close_pairs(points, reach):
+    """
+        All index pairs i < j of points closer than reach, co-located duplicates included
+        :param points: (n x 2) positions
+        :param reach: scalar or (n,) radius around each point, equal for the two points of a pair
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    reach = np.broadcast_to(np.asarray(reach, dtype=float), (len(points),))
+    if len(points) < 2:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    cell = max(reach.max(), 1e-9)
+    i, j, dist = GridIndex(points, cell, cell).query_pairs(points, reach)
+    keep = i < j
+    return i[keep], j[keep], dist[keep]
@@ -0,0 +1,96 @@
+import time
+
+
+class StoppingCriterion():
+    """
+        Condition checked after every step of a run, the run stops at the first criterion met
+    """
+    reason = None
+
+    def start(self, harmony_search, step):
+        """
+            Called when a run starts (or resumes) at step
+        """
+        pass
+
+    def check(self, harmony_search, step, best_ind):
+        """
+            True when the run should stop after step, best_ind is the index of the best harmony in memory
+        """
+        raise NotImplementedError
+
+
+class TimeBudget(StoppingCriterion):
+    reason = "time"
+
+    def __init__(self, seconds):
+        """
+            :param seconds: wall-clock budget of a run, counted again from zero when it resumes
+        """
+        self.seconds = seconds
+
+    def start(self, harmony_search, step):
+        self._deadline = time.perf_counter() + self.seconds
+
+    def check(self, harmony_search, step, best_ind):
+        return time.perf_counter() >= self._deadline
+
+
+class EvaluationBudget(StoppingCriterion):
+    reason = "evaluations"
+
+    def __init__(self, evaluations):
+        """
+            :param evaluations: number of fitness evaluations of a run, memory initialization included
+        """
+        self.evaluations = evaluations
+
+    def check(self, harmony_search, step, best_ind):
+        return harmony_search.evaluations >= self.evaluations
+
+
+class Stagnation(StoppingCriterion):
+    reason = "stagnation"
+
+    def __init__(self, steps):
+        """
+            :param steps: number of steps without improvement of the best fitness
+        """
+        self.steps = steps
+
+    def start(self, harmony_search, step):
+        self._best = float('-inf')
+        self._last = step
+
+    def check(self, harmony_search, step, best_ind):
+        fitness = harmony_search._harmony_memory.fitness[best_ind]
+        if fitness > self._best:
+            self._best = fitness
+            self._last = step
+        return step - self._last >= self.steps
+
+
+class TargetCoverage(StoppingCriterion):
+    reason = "coverage"
+
+    def __init__(self, coverage):
+        """
+            :param coverage: coverage ratio of the best harmony to reach
+        """
+        self.coverage = coverage
+
+    def check(self, harmony_search, step, best_ind):
+        return harmony_search._harmony_memory.coverage[best_ind] >= self.coverage
+
+
+class TargetFitness(StoppingCriterion):
+    reason = "fitness"
+
+    def __init__(self, fitness):
+        """
+            :param fitness: fitness of the best harmony to reach
+        """
+        self.fitness = fitness
+
+    def check(self, harmony_search, step, best_ind):
+        return harmony_search._harmony_memory.fitness[best_ind] >= self.fitness
@@ -0,0 +1,259 @@
+import argparse
+import copy
+import csv
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from tqdm import tqdm
+from harmony_search import HarmonySearch, summarize_runs
+from objective_function import ObjectiveFunction
+from targets import grid_targets, open_targets
+
+# Read-only arrays of an ObjectiveFunction that workers share, as attribute paths
+SHARED_ARRAYS = [("_targets",), ("_target_index", "points"), ("_target_index", "_order"), ("_target_index", "_starts"),
+                 ("model", "_table"), ("model", "_slope")]
+# What a sweep may vary: HarmonySearch arguments and the initialization strategy of the runs
+SWEEP_PARAMETERS = ["hms", "hmcr", "par", "BW", "n_search", "type_init"]
+RUN_COLUMNS = ["config", "seed", "fitness", "coverage", "used", "used_convert", "stop_reason", "stop_step", "evaluations",
+               "seconds"]
+
+
+def _get(obj, path):
+    for name in path:
+        obj = getattr(obj, name, None)
+    return obj
+
+
+def _set(obj, path, value):
+    for name in path[:-1]:
+        obj = getattr(obj, name)
+    setattr(obj, path[-1], value)
+
+
+class SharedProblem():
+    def __init__(self, objective_function):
+        """
+            Problem geometry built once for a whole sweep: the read-only arrays of objective_function (targets, target
+            index, PSM tables) are copied into shared memory, and each worker rebuilds the objective function around
+            them with attach() instead of recomputing or copying them. A memory-mapped target file is reopened instead.
+
+            :param objective_function: ObjectiveFunction of the problem, left untouched
+        """
+        self._buffers = []
+        self._attached = []
+        self._specs = []
+        targets = objective_function._targets
+        self._filename = targets.filename if isinstance(targets, np.memmap) else None
+
+        # Pickled into every worker, so it must not carry the arrays
+        self._template = copy.copy(objective_function)
+        self._template.targets = None
+        for name in ["_target_index", "model"]:
+            setattr(self._template, name, copy.copy(getattr(objective_function, name)))
+        names = {}
+        for path in SHARED_ARRAYS:
+            array = _get(objective_function, path)
+            if array is None:
+                continue
+            _set(self._template, path, None)
+            if isinstance(array, np.memmap):
+                continue
+            # The target index usually holds the target array itself, it is shared once
+            if id(array) not in names:
+                buffer = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=buffer.buf)[...] = array
+                self._buffers.append(buffer)
+                names[id(array)] = buffer.name
+            self._specs.append((path, names[id(array)], array.shape, array.dtype.str))
+
+    def __getstate__(self):
+        return {"_template": self._template, "_specs": self._specs, "_filename": self._filename, "_buffers": [],
+                "_attached": []}
+
+    def attach(self):
+        """
+            The objective function, its arrays mapped from shared memory (call once per process)
+        """
+        buffers = {}
+        for path, name, shape, dtype in self._specs:
+            if name not in buffers:
+                buffers[name] = shared_memory.SharedMemory(name=name)
+            _set(self._template, path, np.ndarray(shape, dtype=np.dtype(dtype), buffer=buffers[name].buf))
+        # Kept open as long as the problem, the arrays point into them
+        self._attached = list(buffers.values())
+        if self._filename is not None:
+            self._template._targets = open_targets(self._filename)
+        self._template.targets = self._template._targets
+        return self._template
+
+    def close(self):
+        """
+            Release the shared memory, in the process that created the problem once the sweep is over
+        """
+        for buffer in self._buffers:
+            buffer.close()
+            buffer.unlink()
+        self._buffers = []
+
+
+def expand_spec(spec, seed=None):
+    """
+        Configurations of a sweep spec, either
+            {"grid": {parameter: [values]}} for every combination of the values, or
+            {"random": {parameter: distribution}, "samples": n} for n random configurations, a distribution being
+            {"choice": [values]}, {"uniform": [low, high]}, {"loguniform": [low, high]} or {"randint": [low, high]}
+        :return: list of {parameter: value}
+    """
+    space = spec.get("grid", spec.get("random", {}))
+    unknown = set(space) - set(SWEEP_PARAMETERS)
+    assert not unknown, "Cannot sweep over {}".format(sorted(unknown))
+    if "grid" in spec:
+        names = list(space)
+        return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(spec["samples"]):
+        config = {}
+        for name, distribution in space.items():
+            (kind, values), = distribution.items()
+            if kind == "choice":
+                config[name] = values[int(rng.integers(len(values)))]
+            elif kind == "uniform":
+                config[name] = float(rng.uniform(*values))
+            elif kind == "loguniform":
+                config[name] = float(np.exp(rng.uniform(np.log(values[0]), np.log(values[1]))))
+            elif kind == "randint":
+                config[name] = int(rng.integers(values[0], values[1] + 1))
+            else:
+                raise ValueError("Unknown distribution {}".format(kind))
+        configs.append(config)
+    return configs
+
+
+_problem = None
+
+
+def _attach_worker(problem):
+    global _problem
+    _problem = problem.attach()
+
+
+def _sweep_job(search_kwargs, config, index, seed, steps, savedir):
+    """
+        One run of configuration index in a worker, on the problem attached by _attach_worker
+    """
+    config = dict(config)
+    type_init = config.pop("type_init", "default")
+    if _problem.cache is not None:
+        _problem.cache.clear()
+    hsa = HarmonySearch(_problem, savedir=os.path.join(savedir, "config{}".format(index), "seed{}".format(seed)),
+                        **dict(search_kwargs, **config))
+    start = time.time()
+    try:
+        result = hsa._run(type_init, steps=steps, seed=seed, progress=False)
+    finally:
+        hsa.close()
+    result.update({"config": index, "evaluations": hsa.evaluations, "seconds": time.time() - start})
+    return result
+
+
+def sweep(objective_function, search_kwargs, configs, seeds, steps, savedir, workers=None):
+    """
+        Run every configuration once per seed over a pool of workers sharing the problem geometry
+
+        :param search_kwargs: HarmonySearch arguments common to all configurations (AoI, cell_size, hmv, lower, upper...)
+        :param configs: list of {parameter: value} overriding search_kwargs, see SWEEP_PARAMETERS
+        :param seeds: seeds every configuration is run with
+        :param savedir: a new directory, every run saves under savedir/config<index>/seed<seed>
+        :param workers: number of worker processes, one per core when not given
+        :return: one row per configuration with its parameters and the mean/std of the metrics of HarmonySearch.test,
+                 also written with the row of every run to savedir/sweep.csv and savedir/runs.csv
+    """
+    os.makedirs(savedir)
+    problem = SharedProblem(objective_function)
+    results = {index: [] for index in range(len(configs))}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach_worker, initargs=(problem,)) as executor:
+            # Seed-major order, so every configuration has finished a few runs early on
+            jobs = [executor.submit(_sweep_job, search_kwargs, configs[index], index, seed, steps, savedir)
+                    for seed in seeds for index in range(len(configs))]
+            with open(os.path.join(savedir, "runs.csv"), "w", newline="") as f:
+                writer = csv.DictWriter(f, RUN_COLUMNS, extrasaction="ignore")
+                writer.writeheader()
+                for job in tqdm(as_completed(jobs), total=len(jobs)):
+                    result = job.result()
+                    results[result["config"]].append(result)
+                    writer.writerow(result)
+                    f.flush()
+    finally:
+        problem.close()
+
+    rows = []
+    for index, config in enumerate(configs):
+        summary, stop_reasons = summarize_runs(results[index], search_kwargs["hmv"])
+        row = {"config": index, **config, "runs": len(results[index])}
+        for name, (mean, std) in summary.items():
+            row[name + "_mean"] = mean
+            row[name + "_std"] = std
+        row["stop_reasons"] = json.dumps(stop_reasons)
+        rows.append(row)
+
+    columns = list(dict.fromkeys(column for row in rows for column in row))
+    with open(os.path.join(savedir, "sweep.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep over one problem")
+    parser.add_argument("spec", type=str, help="json file, or json text, of the sweep (see expand_spec)")
+    parser.add_argument("--W", default=50, type=int)
+    parser.add_argument("--H", default=50, type=int)
+    parser.add_argument("--radius", nargs="+", type=int, default=[5, 10])
+    parser.add_argument("--cellw", default=10, type=int)
+    parser.add_argument("--cellh", default=10, type=int)
+    parser.add_argument("--hmv", default=25, type=int)
+    parser.add_argument("--hms", default=10, type=int)
+    parser.add_argument("--hcmr", default=0.9, type=float)
+    parser.add_argument("--par", default=0.3, type=float)
+    parser.add_argument("--bw", default=0.2, type=float)
+    parser.add_argument("--nsearch", default=10, type=int)
+    parser.add_argument("--iter", default=60000, type=int)
+    parser.add_argument("--numrun", default=12, type=int)
+    parser.add_argument("--seed", default=None, type=int)
+    parser.add_argument("--workers", default=None, type=int)
+    parser.add_argument("--targets", default=None, type=str)
+    parser.add_argument("--membudget", default=None, type=int)
+    parser.add_argument("--psmtable", default=0, type=int)
+    parser.add_argument("--savedir", default="sweep", type=str)
+    args = parser.parse_args()
+
+    if os.path.exists(args.spec):
+        with open(args.spec) as f:
+            spec = json.load(f)
+    else:
+        spec = json.loads(args.spec)
+    configs = expand_spec(spec, args.seed)
+    seeds = random.Random(args.seed).sample(range(2**32), args.numrun)
+
+    w, h, radius = args.W, args.H, args.radius
+    targets = args.targets if args.targets is not None else grid_targets(w, h, args.cellw, args.cellh)
+    obj_func = ObjectiveFunction(args.hmv, args.hms, targets, types=len(radius), radius=radius, w=w, h=h,
+                                 cell_h=args.cellh, cell_w=args.cellw, psm_resolution=args.psmtable,
+                                 memory_budget=args.membudget)
+    search_kwargs = {"AoI": [w, h], "cell_size": [args.cellw, args.cellh], "hms": args.hms, "hmv": args.hmv,
+                     "hmcr": args.hcmr, "par": args.par, "BW": args.bw, "n_search": args.nsearch,
+                     "lower": [[r/2, r/2] for r in radius], "upper": [[w-r/2, h-r/2] for r in radius],
+                     "min_no": w * h // ((max(radius)**2)*9)}
+    print("{} configurations x {} seeds".format(len(configs), len(seeds)))
+    rows = sweep(obj_func, search_kwargs, configs, seeds, args.iter, args.savedir, args.workers)
+    for row in sorted(rows, key=lambda row: -row["fitness_mean"])[:10]:
+        print({name: row[name] for name in ["config"] + list(configs[row["config"]]) + ["fitness_mean", "coverage_mean"]})
@@ -0,0 +1,24 @@
+import numpy as np
+
+
+def grid_targets(w, h, cell_w, cell_h):
+    """
+        One target at the center of every cell of a w x h field
+    """
+    return [[x + cell_w / 2, y + cell_h / 2] for x in np.arange(0, w, cell_w) for y in np.arange(0, h, cell_h)]
+
+
+def save_targets(path, targets):
+    """
+        Write targets (n x 2) as a float32 .npy file that ObjectiveFunction can memory-map
+    """
+    np.save(path, np.asarray(targets, dtype=np.float32).reshape(-1, 2))
+
+
+def open_targets(path):
+    """
+        Memory-map a target file written by save_targets, nothing is read before it is used
+    """
+    targets = np.load(path, mmap_mode="r")
+    assert targets.ndim == 2 and targets.shape[1] == 2, "Targets must be an (n x 2) array"
+    return targets
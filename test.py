@@ -1,9 +1,17 @@
 import argparse
+import json
 import random
 from harmony_search import HarmonySearch
 from objective_function import ObjectiveFunction
+from island_search import IslandHarmonySearch
+from schedules import SCHEDULES
+from stopping import TimeBudget, EvaluationBudget, Stagnation, TargetCoverage, TargetFitness
 
-def train(w, h, types, radius, hms, cellw, cellh, hcmr, par, bw, t, iter, numrun, type_init, min_valid, savedir):
+def train(w, h, types, radius, hms, cellw, cellh, hcmr, par, bw, t, iter, numrun, type_init, min_valid, savedir, nsearch=10, delta=False, workers=1,\
+          islands=1, migint=100, migsize=2, topology="ring", checkpoint=0, resume=False,\
+          textlog=False, instrument=False, profile=None, cache=0, typesamples=1, typerefine=0,\
+          timebudget=None, evalbudget=None, stagnation=None, targetcov=None, targetfit=None,\
+          schedule="constant", psmtable=0, psminterp="linear", targetfile=None, membudget=None, warmstart=None, pareto=0, plot="background"):
     min_noS = w * h // ((max(radius)**2)*9)
     max_noS = w * h // ((min(radius)**2))
     print(min_noS, max_noS)
@@ -20,12 +28,48 @@ def train(w, h, types, radius, hms, cellw, cellh, hcmr, par, bw, t, iter, numrun
             init_y += cellh
         init_x += cellw
         init_y = cellh / 2
-    obj_func = ObjectiveFunction(hmv, hms, targets, types=2, radius=radius, w=w, h=h, cell_h=cellh, cell_w=cellw)
+    if targetfile is not None:
+        targets = targetfile
+    obj_func = ObjectiveFunction(hmv, hms, targets, types=types, radius=radius, w=w, h=h, cell_h=cellh, cell_w=cellw, cache_size=cache,\
+                                 type_samples=typesamples, type_refine=typerefine, psm_resolution=psmtable,\
+                                 psm_interpolation=psminterp, memory_budget=membudget)
     min_noS = w * h // ((max(radius)**2)*9)
+    stopping = []
+    if timebudget is not None:
+        stopping.append(TimeBudget(timebudget))
+    if evalbudget is not None:
+        stopping.append(EvaluationBudget(evalbudget))
+    if stagnation is not None:
+        stopping.append(Stagnation(stagnation))
+    if targetcov is not None:
+        stopping.append(TargetCoverage(targetcov))
+    if targetfit is not None:
+        stopping.append(TargetFitness(targetfit))
     hsa = HarmonySearch(AoI=[w, h], cell_size=[cellw, cellh], objective_function=obj_func, hms=hms, hmv=hmv, hmcr=hcmr, par=par,\
-                        BW=bw, lower=[[radius[0]/2, radius[0]/2], [radius[1]/2, radius[1]/2]],\
-                        upper=[[w-radius[0]/2, h-radius[0]/2], [w-radius[1]/2, h-radius[1]/2]], min_no=min_noS, savedir=savedir)
-    hsa.test(type_init, min_valid, iter, threshold=t, num_run=numrun)
+                        BW=bw, lower=[[r/2, r/2] for r in radius],\
+                        upper=[[w-r/2, h-r/2] for r in radius], min_no=min_noS, savedir=savedir,\
+                        n_search=nsearch, delta_eval=delta, checkpoint_interval=checkpoint, resume=resume,\
+                        text_log=textlog, instrument=instrument, profile_steps=profile,\
+                        stopping=stopping, schedule=SCHEDULES[schedule](), pareto_archive=pareto, plot=plot)
+    initial_harmonies = None
+    if warmstart:
+        # Best harmonies of earlier runs, as saved in their checkpoint/result<order>.json
+        initial_harmonies = []
+        for path in warmstart:
+            with open(path) as f:
+                result = json.load(f)
+            initial_harmonies.append((result["harmony"], result["type"]))
+    try:
+        if islands > 1:
+            island_search = IslandHarmonySearch(hsa, islands, migint, migsize, topology)
+            try:
+                island_search.run(type_init, min_valid, iter)
+            finally:
+                island_search.close()
+        else:
+            hsa.test(type_init, min_valid, iter, threshold=t, num_run=numrun, workers=workers, initial_harmonies=initial_harmonies)
+    finally:
+        hsa.close()
     # hsa.run(1)
 
 if __name__ == "__main__":
@@ -33,7 +77,7 @@ if __name__ == "__main__":
 
     parser.add_argument("--W", default=50, type=int)
     parser.add_argument("--H", default=50, type=int)
-    parser.add_argument("--types", default=2, type=int)
+    parser.add_argument("--types", default=2, type=int, help="number of node types, one --radius each")
     parser.add_argument("--radius", nargs="+")
     parser.add_argument("--hms", default=10, type=int)
     parser.add_argument("--cellw", default=10, type=int)
@@ -41,16 +85,55 @@ if __name__ == "__main__":
     parser.add_argument("--hcmr", default=0.9, type=float)
     parser.add_argument("--par", default=0.3, type=float)
     parser.add_argument("--bw", default=0.2, type=float)
-    parser.add_argument("--t", default=0.9, type=float)
+    parser.add_argument("--t", default=0.9, type=float, help="unused, runs stop on a coverage with --targetcov")
     parser.add_argument("--iter", default=60000, type=int)
     parser.add_argument("--numrun", default=12, type=int)
-    parser.add_argument("--typeinit", default="default", type=str)
+    parser.add_argument("--typeinit", default="default", choices=list(HarmonySearch.INIT_STRATEGIES))
     parser.add_argument("--minvalid", default=14, type=int)
     parser.add_argument("--savedir", default="savedir", type=str)
+    parser.add_argument("--nsearch", default=10, type=int)
+    parser.add_argument("--delta", action="store_true")
+    parser.add_argument("--workers", default=1, type=int)
+    parser.add_argument("--islands", default=1, type=int)
+    parser.add_argument("--migint", default=100, type=int)
+    parser.add_argument("--migsize", default=2, type=int)
+    parser.add_argument("--topology", default="ring", type=str)
+    parser.add_argument("--checkpoint", default=0, type=int)
+    parser.add_argument("--resume", action="store_true")
+    parser.add_argument("--textlog", action="store_true")
+    parser.add_argument("--instrument", action="store_true")
+    parser.add_argument("--profile", nargs=2, type=int, default=None)
+    parser.add_argument("--cache", default=0, type=int)
+    parser.add_argument("--typesamples", default=1, type=int)
+    parser.add_argument("--typerefine", default=0, type=int)
+    parser.add_argument("--timebudget", default=None, type=float)
+    parser.add_argument("--evalbudget", default=None, type=int)
+    parser.add_argument("--stagnation", default=None, type=int)
+    parser.add_argument("--targetcov", default=None, type=float)
+    parser.add_argument("--targetfit", default=None, type=float)
+    parser.add_argument("--schedule", default="constant", choices=list(SCHEDULES))
+    parser.add_argument("--psmtable", default=0, type=int)
+    parser.add_argument("--psminterp", default="linear", choices=["linear", "nearest"])
+    parser.add_argument("--targets", default=None, type=str)
+    parser.add_argument("--membudget", default=None, type=int)
+    parser.add_argument("--warmstart", nargs="+", default=None)
+    parser.add_argument("--pareto", default=0, type=int)
+    parser.add_argument("--plot", default="background", choices=["background", "deferred", "off"])
 
     args = parser.parse_args()
+    if args.islands > 1:
+        ignored = [flag for flag, value in [("--timebudget", args.timebudget), ("--evalbudget", args.evalbudget),
+                                            ("--stagnation", args.stagnation), ("--targetcov", args.targetcov),
+                                            ("--targetfit", args.targetfit), ("--checkpoint", args.checkpoint),
+                                            ("--resume", args.resume), ("--warmstart", args.warmstart)] if value]
+        if ignored:
+            parser.error("{} cannot be used with --islands".format(", ".join(ignored)))
     radius = []
     for i in args.radius:
         radius.append(int(i))
     train(int(args.W), int(args.H), args.types, radius, args.hms, args.cellw, args.cellh, args.hcmr, args.par, 
-            args.bw, args.t, args.iter, args.numrun, args.typeinit, args.minvalid, args.savedir)
+            args.bw, args.t, args.iter, args.numrun, args.typeinit, args.minvalid, args.savedir, args.nsearch, args.delta, args.workers,
+            args.islands, args.migint, args.migsize, args.topology, args.checkpoint, args.resume, args.textlog,
+            args.instrument, args.profile, args.cache, args.typesamples, args.typerefine,
+            args.timebudget, args.evalbudget, args.stagnation, args.targetcov, args.targetfit,
+            args.schedule, args.psmtable, args.psminterp, args.targets, args.membudget, args.warmstart, args.pareto, args.plot)
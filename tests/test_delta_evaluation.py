@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from delta_evaluation import DeltaEvaluator
+from objective_function import ObjectiveFunction
+from targets import grid_targets
+
+
+@pytest.mark.parametrize("options", [{}, {"spatial_index": False}, {"memory_budget": 2**14},
+                                     {"spatial_index": False, "memory_budget": 2**14}, {"psm_resolution": 64}])
+def test_delta_is_bit_identical_to_full_evaluation(options):
+    hms, hmv, batch = 4, 30, 8
+    obj = ObjectiveFunction(hmv, hms, grid_targets(200, 200, 10, 10), types=3, radius=[10, 20, 30], w=200, h=200,
+                            **options)
+    delta = DeltaEvaluator(obj, hms, hmv)
+    rng = np.random.default_rng(0)
+    memory = rng.uniform(0, 200, (hms, hmv, 2))
+    memory[rng.random((hms, hmv)) < 0.2] = -1
+    for slot in range(hms):
+        delta.store(slot, memory[slot])
+
+    # Nodes copied from random slots, a third of them moved or replaced by a new node
+    sources = rng.integers(hms, size=(batch, hmv))
+    candidates = memory[sources, np.arange(hmv)]
+    moved = rng.random((batch, hmv)) < 0.3
+    candidates[moved] = rng.uniform(0, 200, (moved.sum(), 2))
+    sources[moved] = -1
+    types = rng.integers(3, size=(batch, hmv))
+
+    fitness, coverage, traces = delta.get_fitness_batch(candidates, sources, types)
+    expected_fitness, expected_coverage, expected_traces = obj.get_fitness_batch(candidates, types)
+    assert np.array_equal(fitness, expected_fitness)
+    assert np.array_equal(coverage, expected_coverage)
+    assert traces == expected_traces
+    assert coverage.max() > 0
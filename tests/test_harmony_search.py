@@ -0,0 +1,44 @@
+import os
+from harmony_search import HarmonySearch
+from objective_function import ObjectiveFunction
+from targets import grid_targets
+
+
+def make_search(savedir, w=50, h=50, radius=(5, 10), hms=5, hmv=25, **kwargs):
+    obj = ObjectiveFunction(hmv, hms, grid_targets(w, h, 10, 10), types=len(radius), radius=list(radius), w=w, h=h)
+    return HarmonySearch(obj, [w, h], [10, 10], hms=hms, hmv=hmv, lower=[[r/2, r/2] for r in radius],
+                         upper=[[w-r/2, h-r/2] for r in radius], min_no=w * h // ((max(radius)**2)*9),
+                         savedir=str(savedir), plot="off", **kwargs)
+
+
+def read_summary(hsa):
+    with open(os.path.join(hsa.log_dir, 'best_maximum_coverage_ratio.log')) as f:
+        return f.read()
+
+
+def test_parallel_runs_match_serial_runs(tmp_path):
+    summaries = []
+    for workers in [1, 2]:
+        hsa = make_search(tmp_path / "workers{}".format(workers))
+        hsa.test(steps=40, num_run=3, workers=workers, seeds=[1, 2, 3])
+        hsa.close()
+        summaries.append(read_summary(hsa))
+    assert "Best_fitness" in summaries[0]
+    assert summaries[0] == summaries[1]
+
+
+def test_resumed_run_matches_uninterrupted_run(tmp_path):
+    hsa = make_search(tmp_path / "uninterrupted", checkpoint_interval=10)
+    expected = hsa._run(steps=40, seed=7, progress=False)
+    hsa.close()
+
+    hsa = make_search(tmp_path / "interrupted", checkpoint_interval=10)
+    hsa._run(steps=20, seed=7, progress=False)
+    hsa.close()
+    # A run killed after its checkpoint at step 20 leaves no result behind
+    os.remove(os.path.join(hsa.checkpoint_dir, 'result0.json'))
+    hsa = make_search(tmp_path / "interrupted", checkpoint_interval=10, resume=True)
+    resumed = hsa._run(steps=40, progress=False)
+    hsa.close()
+    assert hsa.best_coverage == expected["coverage"]
+    assert resumed == expected
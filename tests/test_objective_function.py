@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from objective_function import ObjectiveFunction
+from targets import grid_targets, save_targets
+
+
+def make_objective(radius=(5, 10), w=50, h=50, **kwargs):
+    return ObjectiveFunction(64, 10, grid_targets(w, h, 10, 10), types=len(radius), radius=list(radius), w=w, h=h,
+                             **kwargs)
+
+
+def random_batch(obj, b, n, seed=0):
+    """
+        b harmonies of n nodes over the field of obj, about a fifth of them unused, and a type for every node
+    """
+    rng = np.random.default_rng(seed)
+    harmonies = rng.uniform(0, [obj.w, obj.h], (b, n, 2))
+    harmonies[rng.random((b, n)) < 0.2] = -1
+    return harmonies, rng.integers(len(obj.radius), size=(b, n))
+
+
+def test_numpy_engine_matches_python_reference():
+    numpy_engine = make_objective(radius=(5, 10, 15), engine="numpy")
+    python_engine = make_objective(radius=(5, 10, 15), engine="python")
+    harmonies, types = random_batch(numpy_engine, 5, 20)
+    for harmony, kinds in zip(harmonies, types):
+        used = harmony[(harmony >= 0).all(axis=1)]
+        trace = kinds[:len(used)].tolist()
+        (fitness, coverage), _ = numpy_engine.get_fitness(harmony.tolist(), trace)
+        (expected_fitness, expected_coverage), _ = python_engine.get_fitness(harmony.tolist(), trace)
+        assert coverage == expected_coverage
+        assert fitness == pytest.approx(expected_fitness, rel=1e-12)
+
+
+@pytest.mark.parametrize("psm_resolution", [0, 64])
+def test_indexed_coverage_matches_dense(psm_resolution):
+    indexed = make_objective(radius=(10, 20), w=200, h=200, spatial_index=True, psm_resolution=psm_resolution)
+    dense = make_objective(radius=(10, 20), w=200, h=200, spatial_index=False, psm_resolution=psm_resolution)
+    harmonies, types = random_batch(indexed, 6, 40)
+    fitness, coverage, traces = indexed.get_fitness_batch(harmonies, types)
+    expected_fitness, expected_coverage, expected_traces = dense.get_fitness_batch(harmonies, types)
+    assert np.array_equal(coverage, expected_coverage)
+    assert np.array_equal(fitness, expected_fitness)
+    assert traces == expected_traces
+    assert coverage.max() > 0
+
+
+@pytest.mark.parametrize("low, high", [(0, 50), (20, 22), (24.5, 25)])
+def test_md_batch_matches_scalar_above_neighbor_threshold(low, high):
+    obj = make_objective()
+    n = obj.NEIGHBOR_MIN_SENSORS
+    rng = np.random.default_rng(0)
+    sensors = rng.uniform(low, high, (4, n, 2))
+    types = rng.integers(len(obj.radius), size=(4, n))
+    valid = np.ones((4, n), dtype=bool)
+    valid[3, n // 2:] = False
+
+    batch = obj._md_batch(sensors, types, valid)
+    for b in range(len(sensors)):
+        used = sensors[b][valid[b]].tolist()
+        assert batch[b] == pytest.approx(obj._md(used, types[b][valid[b]].tolist()), rel=1e-12)
+
+
+def test_cache_is_shared_by_scalar_and_batch_evaluations():
+    obj = make_objective(cache_size=64)
+    harmonies, types = random_batch(obj, 4, 30)
+    fitness, coverage, traces = obj.get_fitness_batch(harmonies, types)
+    for b, harmony in enumerate(harmonies):
+        (each_fitness, each_coverage), _ = obj.get_fitness(harmony.tolist(), traces[b])
+        assert (each_fitness, each_coverage) == (fitness[b], coverage[b])
+    assert obj.cache.hits == len(harmonies)
+
+    # Drawn types are cached on the positions alone, with the trace drawn for them
+    fitness, coverage, traces = obj.get_fitness_batch(harmonies)
+    for b, harmony in enumerate(harmonies):
+        (each_fitness, each_coverage), trace = obj.get_fitness(harmony.tolist())
+        assert (each_fitness, each_coverage, trace) == (fitness[b], coverage[b], traces[b])
+    assert obj.cache.hits == 2 * len(harmonies)
+
+
+def test_coverage_is_a_fraction_of_the_target_file(tmp_path):
+    path = str(tmp_path / "targets.npy")
+    save_targets(path, np.random.default_rng(1).uniform(0, 50, (100, 2)))
+    obj = ObjectiveFunction(64, 10, path, types=1, radius=[10], w=50, h=50)
+    assert obj.no_targets == 100
+
+    # One sensor every 5 units covers every target of the field
+    grid = np.arange(2.5, 50, 5)
+    harmony = np.stack(np.meshgrid(grid, grid), axis=-1).reshape(1, -1, 2)
+    fitness, coverage, _ = obj.get_fitness_batch(harmony, np.zeros(harmony.shape[:2], dtype=int))
+    assert coverage[0] == 1.0
+
+    harmonies, types = random_batch(obj, 6, 30)
+    _, coverage, _ = obj.get_fitness_batch(harmonies, types)
+    assert (coverage <= 1).all() and coverage.max() > 0
+    assert np.array_equal(coverage * 100, np.round(coverage * 100))
+
+
+@pytest.mark.parametrize("spatial_index", [True, False])
+def test_chunked_coverage_matches_unchunked(spatial_index):
+    chunked = make_objective(radius=(10, 20), w=200, h=200, spatial_index=spatial_index, memory_budget=2**12)
+    unchunked = make_objective(radius=(10, 20), w=200, h=200, spatial_index=spatial_index)
+    assert len(chunked._target_chunks(6 * chunked.INDEXED_BYTES)) > 1
+    harmonies, types = random_batch(chunked, 6, 40)
+    fitness, coverage, traces = chunked.get_fitness_batch(harmonies, types)
+    expected_fitness, expected_coverage, expected_traces = unchunked.get_fitness_batch(harmonies, types)
+    assert np.array_equal(coverage, expected_coverage)
+    assert np.array_equal(fitness, expected_fitness)
+    assert traces == expected_traces
+    assert coverage.max() > 0
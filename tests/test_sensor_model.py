@@ -0,0 +1,8 @@
+import numpy as np
+from sensor_model import SensorModel
+
+
+def test_weights_follow_radius_order():
+    assert np.allclose(SensorModel([5, 10, 15]).weights, [1/3, 2/3, 1])
+    assert np.allclose(SensorModel([15, 5, 10]).weights, [1, 1/3, 2/3])
+    assert np.allclose(SensorModel([5, 5, 10]).weights, [2/3, 2/3, 1])
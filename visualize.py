@@ -1,25 +1,22 @@
-import matplotlib.pyplot as plt 
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from targets import open_targets
 
 
-H, W = (50, 50)
-R = [5, 10]
-UE = [x/2 for x in R]
-cell_W, cell_H = (10, 10)
-targets = []
-for h in range(int(abs(H/cell_H))):
-    for w in range(int(abs(W/cell_W))):
-        targets.append((w*cell_W + cell_W/2, h*cell_H + cell_H/2))
-xtarget = [x[0] for x in targets]
-ytarget = [x[1] for x in targets]
+def draw(harmony, types, savepath, radius, targets, field=None):
+    """
+        Plot the used nodes of harmony with their sensing radius over the targets and save it to savepath,
+        matplotlib is only imported here
 
-# harmony = [[36.52235284213187, 5.158923571575547], [5.803977184212332, 16.579737439122482], [19.76909132203916, -1], [16.362401717114682, 42.94448301719304], [39.27175114074775, 10.992642627364102], [16.74205055331246, 38.35399254373819], [27.312578446735305, 13.395017147960669], [43.46952776424973, 30.504267411728666], [-1, 36.5782468817317], [19.529226257956356, 13.674552516931001], [39.30332867498081, 18.56383898679198], [3.3012767353284587, 4.322705960180589], [10.84872319141316, 7.147392967931629], [24.93388616312154, 40.157932114494756], [33.76329870791216, 41.99536186646283], [6.990908167067408, -1], [37.14331736420686, 34.45115519008454], [19.333452467268657, -1], [8.07785057792524, 12.428832873457463], [42.564132363103894, 24.558477993553797], [26.89983254707116, 20.237557138374008], [13.859190969161306, 31.647922005541822], [40.26192064408836, -1], [21.40285292713656, 21.946540792085653], [-1, 33.87291542486836]]
-# types = [1, 1, 1, 1, 1, 1, 0, 1, 0, 0, 1, 1, 1, 1, 1, 1, 0, 1, 1]
+        :param types: type of each used node
+        :param radius: radius of each node type
+        :param targets: (n x 2) target positions
+        :param field: (w, h) of the area of interest, drawn as its border when given
+    """
+    # A Figure outside pyplot is not registered anywhere, it is freed with its last reference
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Circle, Rectangle
 
-
-
-
-def draw(harmony, types, savepath):
-   
     xused = []
     yused = []
     for x in harmony:
@@ -28,14 +25,93 @@ def draw(harmony, types, savepath):
         xused.append(x[0])
         yused.append(x[1])
 
-    fig, ax1 = plt.subplots(1)
-
-    ax1.scatter(xtarget, ytarget, marker=".")
+    fig = Figure()
+    ax1 = fig.subplots(1)
+    targets = np.asarray(targets)
+    ax1.scatter(targets[:, 0], targets[:, 1], marker=".")
     ax1.scatter(xused, yused, marker="*")
     for s in range(len(xused)):
-        ax1.add_patch(plt.Circle((xused[s], yused[s]), R[types[s]], color='r', alpha=0.5, fill=False))
+        ax1.add_patch(Circle((xused[s], yused[s]), radius[types[s]], color='r', alpha=0.5, fill=False))
+    if field is not None:
+        ax1.add_patch(Rectangle((0, 0), field[0], field[1], fill=False))
     ax1.set_aspect('equal', adjustable='datalim')
-    ax1.plot()
     ax1.grid()
-    plt.savefig(savepath)
-    # plt.show()
+    fig.savefig(savepath)
+
+
+class Renderer():
+    def __init__(self, objective_function, mode="background"):
+        """
+            Plots of deployments with the geometry (radius, targets and field) of objective_function, rendered away
+            from the search loop
+
+            :param mode: "background" renders each plot in a separate process as soon as it is submitted,
+                         "deferred" keeps the plots until flush() renders them together, "off" drops them
+        """
+        assert mode in ["background", "deferred", "off"], "Unknown rendering mode"
+        self.mode = mode
+        targets = objective_function._targets
+        self.geometry = {"radius": np.asarray(objective_function.model.radius).tolist(),
+                         "field": (objective_function.w, objective_function.h),
+                         # A memory-mapped target file is reopened by the rendering process instead of being copied
+                         "targets": targets.filename if isinstance(targets, np.memmap) else np.asarray(targets)}
+        self._executor = None
+        self._jobs = []
+        self._futures = []
+
+    def __getstate__(self):
+        # A copy sent to another process starts with no rendering process and no pending plots
+        state = self.__dict__.copy()
+        state.update({"_executor": None, "_jobs": [], "_futures": []})
+        return state
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1, initializer=_init_render, initargs=(self.geometry,))
+        return self._executor
+
+    def submit(self, harmony, types, savepath):
+        """
+            Queue the plot of harmony (its used nodes of types types) to savepath, returns without waiting for it
+        """
+        if self.mode == "off":
+            return
+        if self.mode == "deferred":
+            self._jobs.append((harmony, types, savepath))
+            return
+        self._futures.append(self._pool().submit(_render, harmony, types, savepath))
+
+    def flush(self):
+        """
+            Render the deferred plots, then wait until every plot submitted so far is saved
+        """
+        jobs, self._jobs = self._jobs, []
+        if jobs:
+            self._futures.append(self._pool().submit(_render_all, jobs))
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def close(self):
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+_geometry = None
+
+
+def _init_render(geometry):
+    global _geometry
+    targets = geometry["targets"]
+    _geometry = dict(geometry, targets=open_targets(targets) if isinstance(targets, str) else targets)
+
+
+def _render(harmony, types, savepath):
+    draw(harmony, types, savepath, _geometry["radius"], _geometry["targets"], _geometry["field"])
+
+
+def _render_all(jobs):
+    for job in jobs:
+        _render(*job)